@@ -0,0 +1,818 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import checks
+import encoders
+import ensemble
+import lod
+import renderer
+import sheetsclient
+import simulation
+import testgrids as tg
+import utilityclasses.BufferedStepper as BufferedStepper
+import utilityclasses.GridObject as GridObject
+import utilityclasses.SimArray as SimArray
+import utilityclasses.DeltaEncoder as DeltaEncoder
+import utilityclasses.FakeSheetsService as FakeSheetsService
+import utilityclasses.FrameWriter as FrameWriter
+import utilityclasses.SheetPublisher as SheetPublisher
+import utilityclasses.SpillTrace as SpillTrace
+import utilityclasses.SteadyState as SteadyState
+import utilityclasses.Trajectory as Trajectory
+
+
+# one untimed step first, so numba's jit compilation isn't counted against the first grid
+def timeEngine(engine: str, sim, repeats: int = 5):
+    simulation.runSim(sim, engine=engine)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        simulation.runSim(sim, engine=engine)
+    return (time.perf_counter() - start) / repeats
+
+
+# times one step of each engine on every test grid, after letting the fluid spread for a
+# few steps so most cells are wet like they are during a real run
+def benchmarkEngines(
+    engines=("loop", "numpy", "numba"),
+    warmup_steps: int = 30,
+    grid_ids=checks.TEST_GRID_IDS,
+):
+    for grid_id in grid_ids:
+        sim = simulation.genTestGrid(grid_id)
+        for _ in range(warmup_steps):
+            sim = simulation.runSim(sim, engine="numpy")
+        seconds = {engine: timeEngine(engine, sim) for engine in engines}
+        d, ux, uy = checks.simArrays(sim)
+        kernel = {
+            engine: timeKernel(engine, d, ux, uy)
+            for engine in engines
+            if engine != "loop"
+        }
+        line = ", ".join(
+            f"{engine} {1 / seconds[engine]:.1f} steps/s" for engine in engines
+        )
+        for engine, kernel_seconds in kernel.items():
+            line += (
+                f", {engine} kernel {1 / kernel_seconds:.1f} steps/s"
+                f" ({seconds['loop'] / kernel_seconds:.0f}x the loop)"
+            )
+        print(f"grid {grid_id}: {line}")
+
+
+# steps/sec and per-cell cost of runSim as the grid grows, seeded with a rescaled test grid
+def benchmarkScaling(
+    sizes=(40, 128, 512, 2048), engine: str = "numpy", grid_id: int = 7, min_seconds=1.0
+):
+    for size in sizes:
+        sim = simulation.runSim(
+            simulation.genTestGrid(grid_id, (size, size)), engine=engine
+        )
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds:
+            sim = simulation.runSim(sim, engine=engine)
+            steps += 1
+        seconds = (time.perf_counter() - start) / steps
+        print(
+            f"{engine} {size}x{size}: {1 / seconds:.2f} steps/s, "
+            f"{seconds / (size * size) * 1e9:.1f} ns/cell"
+        )
+
+
+# strong scaling keeps the grid fixed as workers are added, weak scaling grows the grid
+# with the worker count so every worker always owns the same number of rows
+def benchmarkParallel(
+    max_workers: int = None, size: int = 1024, engine: str = "numpy", steps: int = 5
+):
+    max_workers = max_workers or os.cpu_count()
+    serial = {}
+    for mode in ("strong", "weak"):
+        for workers in range(1, max_workers + 1):
+            rows = size if mode == "strong" else size * workers
+            sim = simulation.genTestGrid(7, (rows, size))
+            sim = simulation.runSim(sim, engine=engine, workers=workers)
+            start = time.perf_counter()
+            for _ in range(steps):
+                sim = simulation.runSim(sim, engine=engine, workers=workers)
+            seconds = (time.perf_counter() - start) / steps
+            simulation.closeStripSteppers()
+            serial.setdefault(mode, seconds)
+            # ideal weak scaling keeps the step time flat, ideal strong scaling divides it
+            efficiency = (
+                serial[mode] / (seconds * workers)
+                if mode == "strong"
+                else serial[mode] / seconds
+            )
+            print(
+                f"{mode} {rows}x{size}, {workers} workers: {1 / seconds:.2f} steps/s, "
+                f"efficiency {efficiency:.0%}"
+            )
+
+
+# one batched step for the whole sweep against one runSim call per member. the loop engine
+# is timed on a sample of members and scaled up, running all of them would take minutes
+def benchmarkEnsemble(members: int = 1000, steps: int = 3, loop_sample: int = 20):
+    grids = ensemble.testGridEnsemble(perturbations=members // 7 - 1)
+    start = time.perf_counter()
+    ensemble.runEnsemble(grids, steps, reductions=("mass", "max_speed"))
+    batched = (time.perf_counter() - start) / steps
+
+    separate = {}
+    for engine, sample in (("numpy", len(grids)), ("loop", loop_sample)):
+        sims = [SimArray.SimArray(grid) for grid in grids[:sample]]
+        start = time.perf_counter()
+        for _ in range(steps):
+            sims = [simulation.runSim(sim, engine=engine) for sim in sims]
+        separate[engine] = (time.perf_counter() - start) / steps * len(grids) / sample
+    print(
+        f"ensemble of {len(grids)}: batched {batched * 1e3:.1f} ms/step, "
+        + ", ".join(
+            f"separate {engine} runSim {seconds * 1e3:.1f} ms/step "
+            f"({seconds / batched:.1f}x)"
+            for engine, seconds in separate.items()
+        )
+    )
+
+
+# JSON bytes and request counts per frame for full bodies against delta bodies
+def benchmarkDelta(grid_id: int = 7, steps: int = 30, data: str = "d"):
+    sim = simulation.genTestGrid(grid_id)
+    encoder = DeltaEncoder.DeltaEncoder("l", data)
+    totals = {"full": [0, 0], "delta": [0, 0]}
+    for _ in range(steps):
+        sim = simulation.runSim(sim, engine="numpy")
+        for name, body in (
+            ("full", simulation.genBodyFromSim(sim, "l", data)[0]),
+            ("delta", encoder.encode(sim)),
+        ):
+            totals[name][0] += len(json.dumps(body))
+            totals[name][1] += len(body["requests"])
+        encoder.markSent()
+    print(
+        f"grid {grid_id} over {steps} frames: "
+        + ", ".join(
+            f"{name} {nbytes / steps / 1024:.1f} KiB and {requests / steps:.0f} "
+            "requests per frame"
+            for name, (nbytes, requests) in totals.items()
+        )
+    )
+
+
+# JSON bytes and encode time of the per-cell body against the coalesced grid bodies
+def benchmarkEncoders(grid_id: int = 7, data: str = "d", repeats: int = 10):
+    sim = simulation.genTestGrid(grid_id)
+    for _ in range(10):
+        sim = simulation.runSim(sim, engine="numpy")
+    variants = {
+        "per cell": lambda: simulation.genBodyFromSim(sim, "l", data),
+        "one range": lambda: encoders.genGridBody(sim, "l", data),
+        "8-row bands": lambda: encoders.genGridBody(sim, "l", data, band_rows=8),
+        "one range, 3 digit colour": lambda: encoders.genGridBody(
+            sim, "l", data, color_digits=3
+        ),
+    }
+    for name, encode in variants.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            body, _ = encode()
+        seconds = (time.perf_counter() - start) / repeats
+        print(
+            f"{name}: {len(json.dumps(body)) / 1024:.1f} KiB, "
+            f"{len(body['requests'])} requests, encode {seconds * 1e3:.2f} ms"
+        )
+
+
+# publishing a large grid cell for cell against block averaging it to the 40x40 display
+# first, the reduced body stays the same size whatever the grid size
+def benchmarkLod(sizes=(128, 512, 1024), data: str = "v", repeats: int = 3):
+    for size in sizes:
+        sim = simulation.genTestGrid(7, (size, size))
+        variants = {
+            "full grid": lambda: encoders.genGridBody(sim, "l", data),
+            "40x40 tiles": lambda: encoders.genGridBody(lod.downsample(sim), "l", data),
+        }
+        for name, encode in variants.items():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                body, _ = encode()
+            seconds = (time.perf_counter() - start) / repeats
+            print(
+                f"{size}x{size} {name}: {len(json.dumps(body)) / 1024:.1f} KiB, "
+                f"encode {seconds * 1e3:.1f} ms"
+            )
+
+
+# runs the simulation at full speed into a throttled FakeSheetsService through the
+# background publisher, then checks the fake sheet ends up showing the last frame
+def benchmarkPublisher(
+    seconds: float = 5.0, quota: int = 5, window: float = 2.0, data: str = "d"
+):
+    service = FakeSheetsService.FakeSheetsService(quota=quota, window=window)
+    encoder = DeltaEncoder.DeltaEncoder("l", data)
+
+    def send(body):
+        simulation.updateSheetFromBody(service, "fake", body)
+        encoder.markSent()
+
+    publisher = SheetPublisher.SheetPublisher(
+        encoder.encode,
+        send,
+        report_every=0,
+        limiter=sheetsclient.sheetsLimiter(quota / window * 60 * 2, burst=quota),
+        retries=8,
+    ).start()
+    sim = simulation.genTestGrid(7)
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        sim = simulation.runSim(sim, engine="numpy")
+        publisher.submit(sim)
+        steps += 1
+    publisher.close()
+
+    expected, _ = encoders.genGridBody(sim, "l", data)
+    reference = FakeSheetsService.FakeSheetsService(quota=1)
+    simulation.updateSheetFromBody(reference, "fake", expected)
+    # the delta encoder skips colour changes that stay inside one colour bucket
+    tolerance = 1 / (encoder.color_buckets - 1)
+    matches = all(
+        service.cells[key]["userEnteredValue"] == cell["userEnteredValue"]
+        and all(
+            abs(service.cells[key]["userEnteredFormat"]["backgroundColor"][channel] - c)
+            <= tolerance
+            for channel, c in cell["userEnteredFormat"]["backgroundColor"].items()
+        )
+        for key, cell in reference.cells.items()
+    )
+    print(
+        f"{steps / seconds:.0f} steps/s, {publisher.sent} frames sent at "
+        f"{publisher.fps():.2f} frames/s, {publisher.dropped} dropped, "
+        f"{publisher.merged} merged into retries, {service.throttled} throttled, "
+        f"sheet matches last frame: {matches}"
+    )
+
+
+# frames per second for rendering a state to an image and for rendering plus png encoding
+def benchmarkRenderer(sizes=(40, 512, 2048), grid_id: int = 7, repeats: int = 20):
+    for size in sizes:
+        sim = simulation.genTestGrid(grid_id, (size, size))
+        for _ in range(5):
+            sim = simulation.runSim(sim, engine="numpy")
+        for data in ("d", "v"):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                image = renderer.renderFrame(sim, "l", data)
+            render = (time.perf_counter() - start) / repeats
+            start = time.perf_counter()
+            for _ in range(repeats):
+                png = FrameWriter.pngBytes(renderer.renderFrame(sim, "l", data))
+            total = (time.perf_counter() - start) / repeats
+            print(
+                f"{size}x{size} {data}: {image.shape[1]}x{image.shape[0]} pixels, "
+                f"render {1 / render:.0f} frames/s, with png {1 / total:.0f} frames/s, "
+                f"{len(png) / 1024:.1f} KiB"
+            )
+
+
+# appends a run to a trajectory file, then replays frames from it in random order and
+# checks they match the states that were saved
+def benchmarkTrajectory(grid_id: int = 7, size: int = 512, steps: int = 50):
+    sim = simulation.genTestGrid(grid_id, (size, size))
+    states = [sim]
+    for _ in range(steps):
+        states.append(simulation.runSim(states[-1], engine="numpy"))
+    path = os.path.join(tempfile.mkdtemp(), "run.traj")
+    with Trajectory.Trajectory(path, sim.shape) as trajectory:
+        start = time.perf_counter()
+        for state in states:
+            trajectory.append(state)
+        trajectory.flush()
+        append = (time.perf_counter() - start) / len(states)
+        order = np.random.default_rng(0).permutation(len(states))
+        start = time.perf_counter()
+        for index in order:
+            assert np.array_equal(trajectory[index].density, states[index].density)
+        replay = (time.perf_counter() - start) / len(states)
+    print(
+        f"{size}x{size}: {os.path.getsize(path) / len(states) / 2**20:.2f} MiB/frame, "
+        f"append {append * 1e3:.2f} ms, random replay {replay * 1e3:.2f} ms"
+    )
+    os.remove(path)
+
+
+# streams a long run through reduceFrames and checks memory stays at a few states
+def benchmarkIterate(grid_id: int = 7, steps: int = 2000):
+    sim = simulation.genTestGrid(grid_id)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for step, reduced in simulation.reduceFrames(simulation.iterate(sim, steps)):
+        pass
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"iterate: {steps / seconds:.0f} steps/s with reductions, "
+        f"peak {peak / 1024:.0f} KiB for {steps} steps "
+        f"({sim.nbytes() / 1024:.0f} KiB per state)"
+    )
+
+
+# bytes allocated at peak during one call of step, beyond what was already allocated
+def peakAllocation(step, repeats: int = 5):
+    step()
+    tracemalloc.start()
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        step()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return peak
+
+
+# runSim against BufferedStepper with each conservation check: steps/s, allocations per step,
+# and a check that both produce the same states. what the buffered steps still allocate is
+# numpy's fixed size iterator buffers for the column shifted slices, not grid sized arrays
+def benchmarkBuffered(sizes=(40, 512), grid_id: int = 7, steps: int = 20):
+    for size in sizes:
+        sim = simulation.genTestGrid(grid_id, (size, size))
+        reference = sim
+        stepper = BufferedStepper.BufferedStepper(sim, check="off")
+        for _ in range(steps):
+            reference = simulation.runSim(reference, engine="numpy")
+            stepper.step()
+        assert np.array_equal(reference.density, stepper.state().density)
+
+        state = [sim]
+
+        def runSimStep():
+            state[0] = simulation.runSim(state[0], engine="numpy")
+
+        variants = {"runSim": runSimStep}
+        for check in BufferedStepper.CHECKS:
+            variants[f"buffered, check {check}"] = BufferedStepper.BufferedStepper(
+                sim, check=check, check_every=10
+            ).step
+        for name, step in variants.items():
+            start = time.perf_counter()
+            for _ in range(steps):
+                step()
+            seconds = (time.perf_counter() - start) / steps
+            print(
+                f"{size}x{size} {name}: {1 / seconds:.0f} steps/s, "
+                f"{peakAllocation(step) / 1024:.1f} KiB allocated per step"
+            )
+
+
+# steps/s and state plus workspace memory of the buffered numpy engine at each precision.
+# float32 halves the bytes every pass streams through, which is what bounds large grids
+def benchmarkPrecision(sizes=(128, 512, 1024), grid_id: int = 7, steps: int = 10):
+    for size in sizes:
+        results = {}
+        for name, dtype in simulation.engines.PRECISIONS.items():
+            sim = simulation.genTestGrid(grid_id, (size, size), dtype)
+            stepper = BufferedStepper.BufferedStepper(sim, check="off")
+            stepper.step()
+            start = time.perf_counter()
+            for _ in range(steps):
+                stepper.step()
+            seconds = (time.perf_counter() - start) / steps
+            memory = sum(
+                array.nbytes
+                for array in list(stepper.work.values())
+                + [field for buffers in stepper.buffers for field in buffers]
+            )
+            results[name] = seconds
+            print(
+                f"{size}x{size} {name}: {1 / seconds:.1f} steps/s, "
+                f"{memory / 2**20:.1f} MiB of state and scratch, "
+                f"drift {stepper.drift():.1e}"
+            )
+        print(
+            f"{size}x{size} float32 speedup: "
+            f"{results['float64'] / results['float32']:.2f}x"
+        )
+
+
+# the stable fluids engine at growing timesteps: it must stay finite, keep its mass and
+# leave no divergence, while a spill step costs the same whatever the simulated time.
+# with land the pressure solve is iterative, so a step there is timed separately
+def benchmarkStable(
+    size: int = 128, grid_id: int = 7, steps: int = 50, dts=(1, 5, 20, 100)
+):
+    engines = simulation.engines
+    for dt in dts:
+        sim = simulation.genTestGrid(grid_id, (size, size))
+        d, ux, uy = sim.density, sim.ux, sim.uy
+        mass = engines.totalMass(d)
+        start = time.perf_counter()
+        for _ in range(steps):
+            d, ux, uy = engines.stepStable(d, ux, uy, dt=dt)
+        seconds = (time.perf_counter() - start) / steps
+        assert np.isfinite(d).all() and np.isfinite(ux).all(), f"dt {dt} diverged"
+        assert engines.massConserved(mass, engines.totalMass(d), d.dtype, steps)
+        print(
+            f"{size}x{size} stable dt {dt}: {seconds * 1e3:.1f} ms/step, "
+            f"{steps * dt} time units, max speed {np.hypot(ux, uy).max():.2f}, "
+            f"max density {d.max():.1f}"
+        )
+
+    spill = simulation.genTestGrid(grid_id, (size, size))
+    print(f"{size}x{size} numpy spill step: {timeEngine('numpy', spill) * 1e3:.1f} ms")
+
+    land = np.zeros((size, size), dtype=bool)
+    land[size // 4 : size // 2, size // 3 : size // 3 + 4] = True
+    sim = simulation.genTestGrid(grid_id, (size, size))
+    sim.land = land
+    sim.density[land] = 0
+    for _ in range(5):
+        sim = simulation.runSim(sim, engine="stable")
+    start = time.perf_counter()
+    for _ in range(5):
+        sim = simulation.runSim(sim, engine="stable")
+    seconds = (time.perf_counter() - start) / 5
+    assert not sim.density[land].any() and not sim.ux[land].any()
+    print(f"{size}x{size} stable with land: {seconds * 1e3:.1f} ms/step")
+
+
+# frames at fixed simulated time with CFL sub-stepping against one fixed step per frame.
+# the spill engines always take whole steps, so their frames match the fixed run exactly,
+# only the stable engine's sub-steps follow its velocity
+def benchmarkAdaptive(
+    size: int = 128, grid_id: int = 7, frames: int = 20, cfls=(1.0, 4.0)
+):
+    sim = simulation.genTestGrid(grid_id, (size, size))
+    fixed = list(simulation.iterate(sim, 5 * frames, engine="numpy"))[4::5]
+    adaptive = list(simulation.iterate(sim, frames, frame_time=5.0))
+    assert all(
+        np.array_equal(a.density, b.density) for (_, a), (_, b) in zip(fixed, adaptive)
+    ), "adaptive spill frames differ from the fixed steps"
+    print(f"{size}x{size} adaptive spill frames of 5 time units match 5 fixed steps")
+
+    for engine, frame_time, engine_cfls in (
+        ("numpy", 5.0, (simulation.CFL,)),
+        ("stable", 10.0, cfls),
+    ):
+        for cfl in engine_cfls:
+            state = sim
+            counts = []
+            start = time.perf_counter()
+            for _ in range(frames):
+                state, substeps = simulation.advance(state, frame_time, engine, cfl=cfl)
+                counts.append(substeps)
+            seconds = (time.perf_counter() - start) / frames
+            print(
+                f"{size}x{size} {engine} cfl {cfl}: {seconds * 1e3:.1f} ms/frame of "
+                f"{frame_time:g} time units, sub-steps first {counts[0]}, "
+                f"max {max(counts)}, last {counts[-1]}"
+            )
+
+
+# how long the stable engine takes to settle, what tracking the residual costs next to a
+# step, and how many steady frames the publisher's identical frame check leaves out. the
+# spill rule never settles, its cells keep trading fluid back and forth
+def benchmarkSteady(
+    size: int = 40, grid_id: int = 7, tolerance: float = 1e-3, limit: int = 20000
+):
+    steady = SteadyState.SteadyState(tolerance)
+    tracking = 0.0
+    stepping = time.perf_counter()
+    for step, sim in simulation.iterate(
+        simulation.genTestGrid(grid_id, (size, size)), limit, engine="stable"
+    ):
+        start = time.perf_counter()
+        steady.update(sim)
+        tracking += time.perf_counter() - start
+        if steady.steady:
+            break
+    stepping = time.perf_counter() - stepping - tracking
+    print(
+        f"{size}x{size} stable: steady after {step} steps at tolerance {tolerance:g}, "
+        f"residual tracking {tracking / stepping:.1%} of step time"
+    )
+
+    shown = encoders.displaySignature(sim, "l", "d")
+    skipped = 0
+    frames = 100
+    for _, sim in simulation.iterate(sim, frames, engine="stable"):
+        signature = encoders.displaySignature(sim, "l", "d")
+        if encoders.sameSignature(signature, shown):
+            skipped += 1
+        else:
+            shown = signature
+    print(f"{size}x{size} stable: {skipped} of {frames} steady frames look identical")
+
+    still = simulation.genTestGrid(0, (size, size))
+    steady = SteadyState.SteadyState(tolerance)
+    for step, sim in simulation.iterate(still, 100, engine="numpy"):
+        steady.update(sim)
+        if steady.steady:
+            break
+    print(f"{size}x{size} empty grid: steady after {step} steps")
+
+
+# a test grid placed in the corner of a large empty domain, stepped by the full numpy
+# engine and by the active tile engine
+def benchmarkActive(size: int = 2048, grid_size: int = 256, grid_id: int = 7, steps=5):
+    grid = simulation.genTestGrid(grid_id, (grid_size, grid_size))
+    density = np.zeros((size, size))
+    density[:grid_size, :grid_size] = grid.density
+    sim = SimArray.SimArray.fromArrays(
+        density, np.zeros_like(density), np.zeros_like(density)
+    )
+    results = {}
+    for engine in ("numpy", "active"):
+        state = sim
+        start = time.perf_counter()
+        for _ in range(steps):
+            state = simulation.runSim(state, engine=engine)
+        results[engine] = state
+        print(
+            f"{size}x{size} with {np.mean(state.density > 0):.1%} wet, {engine}: "
+            f"{steps / (time.perf_counter() - start):.2f} steps/s"
+        )
+    assert np.array_equal(results["numpy"].density, results["active"].density)
+
+
+# cost of a loop step without tracing, with a SpillTrace and with verbose printing
+def benchmarkTrace(grid_id: int = 7, steps: int = 10):
+    sim = simulation.genTestGrid(grid_id)
+    for _ in range(10):
+        sim = simulation.runSim(sim, engine="numpy")
+    trace = SpillTrace.SpillTrace()
+    variants = {
+        "off": lambda: simulation.runSim(sim),
+        "trace": lambda: simulation.runSim(sim, trace=trace),
+        "verbose": lambda: simulation.runSim(sim, verbose=True),
+    }
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        seconds = {
+            name: bestTime(step, repeats=steps) for name, step in variants.items()
+        }
+    print(
+        ", ".join(
+            f"{name} {value * 1e3:.2f} ms/step" for name, value in seconds.items()
+        )
+        + f", {trace.count // trace.steps} spill events/step"
+    )
+
+
+# bytes per cell of the old nested list of GridObjects against the SimArray arrays
+def measureStateMemory(grid_id: int = 7):
+    grid = tg.getTestGrid(grid_id)
+
+    tracemalloc.start()
+    objects = [
+        [GridObject.GridObject(float(grid[x][y]), (x, y)) for y in range(len(grid[0]))]
+        for x in range(len(grid))
+    ]
+    object_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    sim = SimArray.SimArray(grid)
+    array_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cells = len(objects) * len(objects[0])
+    print(
+        f"grid {grid_id}: GridObjects {object_bytes / cells:.1f} bytes/cell, "
+        f"SimArray {array_bytes / cells:.1f} bytes/cell "
+        f"({object_bytes / array_bytes:.0f}x smaller, arrays {sim.nbytes() / cells:.0f})"
+    )
+
+
+def timeKernel(engine: str, d, ux, uy, repeats: int = 200):
+    step = simulation.engines.ENGINES[engine]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step(d, ux, uy)
+    return (time.perf_counter() - start) / repeats
+
+
+# the regression suite: times the hot paths on every test grid at several sizes, saves the
+# results as a baseline json and compares later runs against it
+
+# steps each grid is run for before it is measured, so most cells are wet
+SUITE_WARMUP_STEPS = 10
+# metrics where a bigger value is a regression
+SUITE_METRICS = ("seconds", "peak_bytes", "json_bytes")
+
+
+# fastest of `repeats` timings of fn, each averaged over enough calls to take min_seconds.
+# the garbage collector is off while timing, like timeit, so its pauses don't add noise
+def bestTime(fn, repeats: int = 5, min_seconds: float = 0.05):
+    fn()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _bestTime(fn, repeats, min_seconds)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _bestTime(fn, repeats: int, min_seconds: float):
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+        calls *= 2
+    best = elapsed / calls
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def peakMemory(fn):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result
+
+
+# (name, cells, fn, size_of) for every measured call, size_of gives the json bytes of a result
+def suiteCases(grid_ids, sizes, engine: str, body_sizes):
+    for size in sizes:
+        for grid_id in grid_ids:
+            initial = simulation.genTestGrid(grid_id, (size, size))
+            sim = initial
+            for _ in range(SUITE_WARMUP_STEPS):
+                sim = simulation.runSim(sim, engine=engine)
+            case = f"grid{grid_id}/{size}x{size}"
+            cells = size * size
+            yield (
+                f"runSim/{engine}/{case}",
+                cells,
+                lambda sim=sim: simulation.runSim(sim, engine=engine),
+                None,
+            )
+            if size in body_sizes:
+                yield (
+                    f"genBodyFromSim/{case}",
+                    cells,
+                    lambda sim=sim: simulation.genBodyFromSim(sim, "l", "v"),
+                    lambda result: len(json.dumps(result[0])),
+                )
+            yield (
+                f"SimArray/{case}",
+                cells,
+                lambda density=initial.density: SimArray.SimArray(density),
+                None,
+            )
+            yield f"SimArray.copy/{case}", cells, sim.copy, None
+
+
+def runSuite(
+    grid_ids=checks.TEST_GRID_IDS,
+    sizes=(40, 128, 512),
+    engine: str = "numpy",
+    body_sizes=(40, 128),
+    min_seconds: float = 0.05,
+):
+    results = {}
+    for name, cells, fn, size_of in suiteCases(grid_ids, sizes, engine, body_sizes):
+        seconds = bestTime(fn, min_seconds=min_seconds)
+        peak, result = peakMemory(fn)
+        results[name] = {
+            "seconds": seconds,
+            "calls_per_s": 1 / seconds,
+            "ns_per_cell": seconds / cells * 1e9,
+            "peak_bytes": peak,
+        }
+        if size_of is not None:
+            results[name]["json_bytes"] = size_of(result)
+        print(
+            f"{name}: {1 / seconds:.1f}/s, {seconds / cells * 1e9:.1f} ns/cell, "
+            f"peak {peak / 1024:.0f} KiB"
+            + (
+                f", {results[name]['json_bytes'] / 1024:.0f} KiB json"
+                if size_of
+                else ""
+            )
+        )
+    return results
+
+
+def saveBaseline(results, path: str):
+    baseline = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=1)
+
+
+# (name, metric, before, after) for every metric that grew by more than threshold
+def compareResults(results, baseline, threshold: float = 0.25):
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in SUITE_METRICS:
+            if metric in metrics and before.get(metric):
+                if metrics[metric] > before[metric] * (1 + threshold):
+                    regressions.append((name, metric, before[metric], metrics[metric]))
+    return regressions
+
+
+# runs the suite and compares it with the baseline at path, or saves it as the baseline
+# when there is none yet or save is set. returns the number of regressions
+def checkRegressions(
+    path: str = "benchmark_baseline.json",
+    threshold: float = 0.25,
+    save: bool = False,
+    **suite,
+):
+    results = runSuite(**suite)
+    if save or not os.path.exists(path):
+        saveBaseline(results, path)
+        print(f"Saved {len(results)} results as the baseline in {path}")
+        return 0
+    with open(path) as file:
+        baseline = json.load(file)["results"]
+    regressions = compareResults(results, baseline, threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.4g} -> {after:.4g}")
+    compared = len(results.keys() & baseline.keys())
+    print(
+        f"{len(regressions)} regressions over {threshold:.0%} "
+        f"in {compared} results compared with {path}"
+    )
+    return len(regressions)
+
+
+def runAll():
+    checks.runChecks()
+    benchmarkEngines()
+    measureStateMemory()
+    benchmarkScaling(sizes=(40, 80), engine="loop")
+    benchmarkScaling()
+    benchmarkParallel()
+    benchmarkEnsemble()
+    benchmarkDelta()
+    benchmarkEncoders()
+    benchmarkLod()
+    benchmarkPublisher()
+    benchmarkRenderer()
+    benchmarkTrajectory()
+    benchmarkIterate()
+    benchmarkBuffered()
+    benchmarkPrecision()
+    benchmarkActive()
+    benchmarkStable()
+    benchmarkAdaptive()
+    benchmarkSteady()
+    benchmarkTrace()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the fluid simulation")
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        default="all",
+        choices=("all", "suite"),
+        help="all runs the checks and every benchmark, suite the regression suite",
+    )
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save", action="store_true", help="save a new baseline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40, 128, 512])
+    parser.add_argument("--engine", default="numpy")
+    args = parser.parse_args()
+    if args.mode == "suite":
+        failures = checkRegressions(
+            args.baseline,
+            args.threshold,
+            args.save,
+            sizes=args.sizes,
+            engine=args.engine,
+        )
+        sys.exit(1 if failures else 0)
+    runAll()
@@ -0,0 +1,237 @@
+import os
+import tempfile
+
+import numpy as np
+
+import ensemble
+import simulation
+import testgrids as tg
+import utilityclasses.Trajectory as Trajectory
+
+# quick correctness checks, separate from the benchmarks so they can run on every change:
+#     python checks.py
+# every check asserts and prints what it verified, the whole set runs in under a minute
+
+# test grid ids that getTestGrid knows about
+TEST_GRID_IDS = [1, 2, 3, 4, 5, 6, 7]
+
+
+def simArrays(sim):
+    return sim.density, sim.ux, sim.uy
+
+
+# steps every test grid with the python loop and with the given engine and checks that
+# both produce the same densities and velocities after every step
+def checkEquivalence(engine: str = "numpy", steps: int = 20, grid_ids=TEST_GRID_IDS):
+    for grid_id in grid_ids:
+        reference = simulation.genTestGrid(grid_id)
+        candidate = simulation.genTestGrid(grid_id)
+        for step in range(steps):
+            reference = simulation.runSim(reference, engine="loop")
+            candidate = simulation.runSim(candidate, engine=engine)
+            for name, expected, actual in zip(
+                ("density", "ux", "uy"), simArrays(reference), simArrays(candidate)
+            ):
+                assert np.allclose(
+                    expected, actual, rtol=1e-12, atol=1e-12, equal_nan=True
+                ), f"{engine} {name} differs from the loop on grid {grid_id}, step {step}"
+        print(f"grid {grid_id}: {engine} matches the loop for {steps} steps")
+
+
+# compares an engine directly against stepLoop on random grids with random velocities,
+# which exercises the direction factors and wall reflections that runSim's rest start skips
+# with land, a random quarter of the cells are land and some of them hold fluid
+def checkRandomStates(
+    engine: str = "numpy", trials: int = 200, seed: int = 0, land: bool = False
+):
+    rng = np.random.default_rng(seed)
+    step = simulation.engines.ENGINES[engine]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for trial in range(trials):
+            shape = tuple(rng.integers(1, 16, 2))
+            d = rng.uniform(0, 100, shape) * (rng.random(shape) > 0.4)
+            ux = rng.normal(0, 1.5, shape)
+            uy = rng.normal(0, 1.5, shape)
+            mask = rng.random(shape) < 0.25 if land else None
+            for expected, actual in zip(
+                simulation.engines.stepLoop(d, ux, uy, land=mask),
+                step(d, ux, uy, land=mask),
+            ):
+                assert np.array_equal(
+                    expected, actual, equal_nan=True
+                ), f"{engine} differs from the loop on random state {trial} {shape}"
+    print(
+        f"{engine} matches the loop on {trials} random states"
+        + (" with land" if land else "")
+    )
+
+
+# the random states above are smaller than a tile, so the active engine steps all of them.
+# these put a few wet patches on larger grids and step them with small tiles, so most tiles
+# are skipped and the windows around the wet ones have to reproduce the full step
+def checkSparseStates(
+    engine: str = "active", trials: int = 60, seed: int = 0, tiles=(4, 8, 16)
+):
+    rng = np.random.default_rng(seed)
+    step = simulation.engines.ENGINES[engine]
+    skipped = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for trial in range(trials):
+            shape = tuple(rng.integers(20, 120, 2))
+            tile = int(rng.choice(tiles))
+            d = np.zeros(shape)
+            for _ in range(rng.integers(1, 4)):
+                row, col = rng.integers(0, shape[0]), rng.integers(0, shape[1])
+                height, width = rng.integers(1, 8, 2)
+                patch = d[row : row + height, col : col + width]
+                patch[...] = rng.uniform(0, 100, patch.shape)
+            ux = rng.normal(0, 1.5, shape)
+            uy = rng.normal(0, 1.5, shape)
+            mask = rng.random(shape) < 0.1 if trial % 2 else None
+            windows = simulation.engines.activeWindows(d, tile)
+            if (
+                sum(
+                    (rows.stop - rows.start) * (stop - start)
+                    for rows, start, stop in windows
+                )
+                < d.size
+            ):
+                skipped += 1
+            for expected, actual in zip(
+                simulation.engines.stepLoop(d, ux, uy, land=mask),
+                step(d, ux, uy, land=mask, tile=tile),
+            ):
+                assert np.array_equal(
+                    expected, actual, equal_nan=True
+                ), f"{engine} differs from the loop on sparse state {trial} {shape} tile {tile}"
+    assert skipped, "no sparse state left a tile out"
+    print(
+        f"{engine} matches the loop on {trials} sparse states, {skipped} of them with tiles skipped"
+    )
+
+
+# float32 steps can't match the float64 loop bit for bit, so every engine stepping a float32
+# state is held to the loop within float32 rounding instead, and runs of it to the mass
+# tolerance the conservation checks use
+def checkPrecision(
+    engine: str = "numpy", trials: int = 50, seed: int = 0, steps: int = 200
+):
+    rng = np.random.default_rng(seed)
+    step = simulation.engines.ENGINES[engine]
+    worst = 0.0
+    for trial in range(trials):
+        shape = tuple(rng.integers(1, 16, 2))
+        d = rng.uniform(0, 100, shape) * (rng.random(shape) > 0.4)
+        mask = rng.random(shape) < 0.25
+        rest = np.zeros(shape)
+        single = d.astype(np.float32)
+        rest_single = rest.astype(np.float32)
+        for expected, actual in zip(
+            simulation.engines.stepLoop(single.astype(float), rest, rest, land=mask),
+            step(single, rest_single, rest_single, land=mask),
+        ):
+            assert actual.dtype == np.float32, f"{engine} returned {actual.dtype}"
+            error = np.max(
+                np.abs(actual - expected) / (np.abs(expected) + 1), initial=0
+            )
+            worst = max(worst, float(error))
+    assert worst < 1e-4, f"{engine} float32 differs from the loop by {worst:.2e}"
+
+    sim = simulation.genTestGrid(7, dtype=np.float32)
+    initial = simulation.engines.totalMass(sim.density)
+    for _ in range(steps):
+        sim = simulation.runSim(sim, engine=engine)
+    mass = simulation.engines.totalMass(sim.density)
+    assert simulation.engines.massConserved(initial, mass, np.float32, steps)
+    print(
+        f"{engine} float32 is within {worst:.1e} of the loop on {trials} random states, "
+        f"mass drift {abs(mass - initial) / initial:.1e} over {steps} steps"
+    )
+
+
+# the stable engine through runSim at growing timesteps, with and without land. runSim
+# checks the mass of every step, and the density must never rise above where it started,
+# up to the rounding and the conjugate gradient tolerance around land
+def checkStable(size: int = 64, grid_id: int = 7, steps: int = 60, dts=(1, 5, 20)):
+    land = np.zeros((size, size), dtype=bool)
+    land[size // 4 : size // 2, size // 3 : size // 3 + 4] = True
+    for dt in dts:
+        for mask in (None, land):
+            sim = simulation.genTestGrid(grid_id, (size, size))
+            if mask is not None:
+                sim.land = mask
+                sim.density[mask] = 0
+            start_max = sim.density.max()
+            highest = start_max
+            for _ in range(steps):
+                sim = simulation.runSim(sim, engine="stable", dt=dt)
+                highest = max(highest, sim.density.max())
+            assert highest <= start_max * (
+                1 + 1e-5
+            ), f"stable dt {dt} raised the max density from {start_max} to {highest}"
+            assert sim.density.min() >= 0
+    print(f"stable keeps its mass and max density for {steps} steps at dt {dts}")
+
+
+# the batched ensemble against runSim on every test grid, given as the nested lists
+# getTestGrid returns so full cells are read like SimArray reads them
+def checkEnsemble(steps: int = 5, grid_ids=TEST_GRID_IDS):
+    snapshots = ensemble.runEnsemble(
+        [tg.getTestGrid(grid_id) for grid_id in grid_ids], steps
+    )
+    for member, grid_id in enumerate(grid_ids):
+        sim = simulation.genTestGrid(grid_id)
+        for step in range(steps):
+            sim = simulation.runSim(sim, engine="numpy")
+            assert np.array_equal(
+                snapshots[step][0][member], sim.density
+            ), f"ensemble member {member} differs from runSim on grid {grid_id}"
+    print(f"ensemble matches runSim on {len(grid_ids)} test grids for {steps} steps")
+
+
+# resuming a trajectory keeps its later frames readable until the next append, frames read
+# before the cut stay valid after it, and steps that don't increase are refused
+def checkTrajectory(steps: int = 10):
+    frames = list(simulation.iterate(simulation.genTestGrid(7), steps, engine="numpy"))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "check.traj")
+        with Trajectory.Trajectory(path, frames[0][1].shape) as trajectory:
+            for step, sim in frames:
+                trajectory.append(sim, step)
+            late = trajectory[steps - 1]
+            mass = late.density.sum()
+            step, sim = trajectory.resume(3)
+            assert len(trajectory) == steps, "resume removed frames before an append"
+            trajectory.append(frames[step][1], step + 1)
+            assert list(trajectory.steps()) == list(range(1, step + 2))
+            assert late.density.sum() == mass, "a frame read before the cut changed"
+            try:
+                trajectory.append(sim, step)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("a repeated step was appended")
+            del late
+    print(
+        f"trajectory resumes without losing frames early and keeps its steps in order"
+    )
+
+
+def runChecks():
+    checkEquivalence("numpy")
+    checkEquivalence("numba")
+    checkRandomStates("numpy")
+    checkRandomStates("numba")
+    checkRandomStates("numpy", land=True)
+    checkRandomStates("numba", land=True)
+    checkRandomStates("active", land=True)
+    checkSparseStates("active")
+    for engine in ("loop", "numpy", "numba", "active"):
+        checkPrecision(engine)
+    checkEnsemble()
+    checkTrajectory()
+    checkStable()
+
+
+if __name__ == "__main__":
+    runChecks()
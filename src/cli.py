@@ -0,0 +1,234 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import engines
+import lod
+import simulation
+import utilityclasses.FrameWriter as FrameWriter
+import utilityclasses.SteadyState as SteadyState
+
+# runs a simulation without the settings window. only numpy and the simulation modules are
+# imported up front, the renderer, trajectory files, numba and the google client are loaded
+# by the backend or engine that needs them, so a headless run starts quickly and works
+# without tkinter or the google libraries installed
+
+BACKENDS = ("auto", "png", "video", "trajectory", "sheets", "none")
+
+TRAJECTORY_EXTENSIONS = (".traj", ".trj")
+
+
+# the backend an output name implies: a video file, a trajectory file or a png sequence
+def backendFor(output: str):
+    if output is None:
+        return "none"
+    if output.lower().endswith(FrameWriter.VIDEO_EXTENSIONS):
+        return "video"
+    if output.lower().endswith(TRAJECTORY_EXTENSIONS):
+        return "trajectory"
+    return "png"
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fluid simulation headless")
+    parser.add_argument("--grid", type=int, default=7, help="test grid id")
+    parser.add_argument("--display", default="d", choices=("d", "vx", "vy", "v"))
+    parser.add_argument("--interpolation", default="l", choices=("l", "q"))
+    parser.add_argument("--engine", default="numpy", choices=tuple(engines.ENGINES))
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--every", type=int, default=1, help="keep every nth step")
+    parser.add_argument("--shape", type=int, nargs=2, metavar=("ROWS", "COLS"))
+    parser.add_argument(
+        "--land", help="a .npy boolean mask of the grid's shape whose cells are land"
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--frame-time",
+        type=float,
+        help="simulated time per step, advanced in adaptive sub-steps",
+    )
+    parser.add_argument("--cfl", type=float, default=simulation.CFL)
+    parser.add_argument(
+        "--max-dt",
+        type=float,
+        help="largest adaptive sub-step, at most the engine's own cap",
+    )
+    parser.add_argument(
+        "--steady-tolerance",
+        type=float,
+        help="stop once no cell changes by more than this between kept steps",
+    )
+    parser.add_argument(
+        "--precision", default="float64", choices=tuple(engines.PRECISIONS)
+    )
+    parser.add_argument("--scale", type=int, help="pixels per cell of rendered frames")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument(
+        "--display-shape",
+        type=int,
+        nargs=2,
+        metavar=("ROWS", "COLS"),
+        help="average larger grids down to this many cells when rendering or publishing",
+    )
+    parser.add_argument(
+        "--center",
+        type=int,
+        nargs=2,
+        metavar=("ROW", "COL"),
+        help="show the display sized region around this cell at full resolution",
+    )
+    parser.add_argument(
+        "--zoom", type=float, default=1, help="cells per display cell around --center"
+    )
+    parser.add_argument(
+        "--output", help="png directory or pattern, video file or .traj file"
+    )
+    parser.add_argument("--backend", default="auto", choices=BACKENDS)
+    parser.add_argument("--spreadsheet", help="spreadsheet id for the sheets backend")
+    parser.add_argument("--range", help="sheet range, generated from the grid shape")
+    parser.add_argument(
+        "--encoding", default="grid", choices=("cells", "grid", "delta")
+    )
+    parser.add_argument("--interval", type=float, default=0, help="seconds per step")
+    parser.add_argument("--token", default="token.json")
+    parser.add_argument("--credentials", default="credentials.json")
+    args = parser.parse_args(argv)
+    if args.backend == "auto":
+        args.backend = "sheets" if args.spreadsheet else backendFor(args.output)
+    if args.backend in ("png", "video", "trajectory") and args.output is None:
+        parser.error(f"the {args.backend} backend needs --output")
+    if args.backend in ("png", "video") and backendFor(args.output) != args.backend:
+        # FrameWriter picks a video or a png sequence from the output name
+        parser.error(f"{args.output} is not a {args.backend} output")
+    if args.backend == "sheets" and args.spreadsheet is None:
+        parser.error("the sheets backend needs --spreadsheet")
+    return args
+
+
+# the display sized view of a state the render and sheets backends show, None for all of it
+def displayWindow(args, shape):
+    if args.center is None:
+        return None
+    display = tuple(args.display_shape or lod.DISPLAY_SHAPE)
+    return lod.zoomWindow(shape, args.center, display, args.zoom)
+
+
+# an iterate until callback that stops once the run is steady, None without a tolerance
+def steadyUntil(tolerance: float = None):
+    if tolerance is None:
+        return None
+    steady = SteadyState.SteadyState(tolerance)
+
+    def until(step, sim):
+        steady.update(sim)
+        if steady.steady:
+            print(f"Steady at step {step} (residual {steady.residual:.2e})")
+        return steady.steady
+
+    return until
+
+
+def runSheets(args, grid):
+    creds = simulation.sheetsclient.loadCredentials(
+        simulation.SCOPES, args.token, args.credentials
+    )
+    simulation.main(
+        creds,
+        args.spreadsheet,
+        args.range,
+        TEST_GRID_ID=args.grid,
+        DATA_DISPLAY_TYPE=args.display,
+        COLOR_INTERPOLATION=args.interpolation,
+        VERBOSE_VAL=False,
+        ENGINE=args.engine,
+        GRID_SHAPE=grid.shape,
+        WORKERS=args.workers,
+        BODY_ENCODING=args.encoding,
+        STEP_INTERVAL=args.interval,
+        STEPS=args.steps,
+        PRECISION=args.precision,
+        FRAME_TIME=args.frame_time,
+        CFL_NUMBER=args.cfl,
+        MAX_TIMESTEP=args.max_dt,
+        STEADY_TOLERANCE=args.steady_tolerance,
+        STEADY_STOP=True,
+        LAND=grid.land,
+        DISPLAY_SHAPE=args.display_shape and tuple(args.display_shape),
+        DISPLAY_WINDOW=displayWindow(args, grid.shape),
+    )
+
+
+# writes the initial grid and every `every`th step to the chosen backend, returns the
+# number of frames written
+def run(args):
+    grid = simulation.genTestGrid(
+        args.grid,
+        args.shape and tuple(args.shape),
+        engines.PRECISIONS[args.precision],
+        args.land and np.load(args.land),
+    )
+    if args.backend == "sheets":
+        runSheets(args, grid)
+        return args.steps // args.every
+    frames = simulation.iterate(
+        grid,
+        args.steps,
+        args.every,
+        args.engine,
+        args.workers,
+        frame_time=args.frame_time,
+        cfl=args.cfl,
+        max_dt=args.max_dt,
+        until=steadyUntil(args.steady_tolerance),
+        # every backend is done with a frame before it takes the next, the steady check
+        # also compares it with the previous frame, which buffering keeps only for every 1
+        buffered=args.every == 1 or args.steady_tolerance is None,
+    )
+    if args.backend == "trajectory":
+        import utilityclasses.Trajectory as Trajectory
+
+        # every run writes a new file like the other backends, an existing trajectory is
+        # replaced instead of getting a second run appended to it
+        open(args.output, "wb").close()
+        with Trajectory.Trajectory(args.output, grid.shape, grid.dtype) as trajectory:
+            trajectory.append(grid, 0)
+            for step, sim in frames:
+                trajectory.append(sim, step)
+            return len(trajectory)
+    if args.backend == "none":
+        return sum(1 for _ in frames)
+    import renderer
+
+    window = displayWindow(args, grid.shape)
+    display = args.display_shape and tuple(args.display_shape)
+    if window is not None and display is None:
+        display = lod.DISPLAY_SHAPE
+
+    def render(sim):
+        if display is not None or window is not None:
+            sim = lod.downsample(sim, display or sim.shape, window)
+        return renderer.renderFrame(sim, args.interpolation, args.display, args.scale)
+
+    with FrameWriter.FrameWriter(args.output, args.fps) as writer:
+        writer.write(render(grid))
+        for _, sim in frames:
+            writer.write(render(sim))
+        return writer.frames
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    start = time.perf_counter()
+    frames = run(args)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.steps} steps of grid {args.grid} with the {args.engine} engine, "
+        f"{frames} frames to {args.backend} in {elapsed:.2f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import numpy as np
+
+# array versions of the per-cell formatting in simulation.genBodyFromSim, shared by the
+# encoders that build sheet bodies from whole grids instead of one cell at a time
+
+ARROWS = ["↗", "↖", "↘", "↙", "→", "←", "↑", "↓"]
+
+
+def fontSize(data: str):
+    return 7 if data == "d" else 10
+
+
+def valueKey(data: str):
+    return "stringValue" if data == "v" else "numberValue"
+
+
+def cellFields(data: str, font: bool = True):
+    return (
+        "userEnteredFormat.backgroundColor,"
+        + ("userEnteredFormat.textFormat.fontSize," if font else "")
+        + "userEnteredValue."
+        + valueKey(data)
+    )
+
+
+def displayDensity(sim):
+    return np.minimum(sim.density, 100)
+
+
+# index into ARROWS for every cell, len(ARROWS) where the fluid is still ("•")
+def arrowIndex(ux, uy):
+    conditions = [
+        (ux > 0) & (uy > 0),
+        (ux < 0) & (uy > 0),
+        (ux > 0) & (uy < 0),
+        (ux < 0) & (uy < 0),
+        (ux > 0) & (uy == 0),
+        (ux < 0) & (uy == 0),
+        (ux == 0) & (uy > 0),
+        (ux == 0) & (uy < 0),
+    ]
+    return np.select(conditions, range(len(ARROWS)), default=len(ARROWS))
+
+
+def arrowGlyphs(ux, uy):
+    return np.array(ARROWS + ["•"])[arrowIndex(ux, uy)]
+
+
+# the value shown in every cell for a display type. always a new array, the delta encoder
+# and the frame signatures keep them after the state they came from may have been reused
+def displayValues(sim, data: str):
+    match data:
+        case "d":
+            return np.round(displayDensity(sim)).astype(int)
+        case "vx":
+            return sim.ux.copy()
+        case "vy":
+            return sim.uy.copy()
+        case "v":
+            return arrowGlyphs(sim.ux, sim.uy)
+        case "_":
+            return np.full(sim.shape, "")
+    return np.zeros(sim.shape, dtype=int)
+
+
+# (red, green, blue) arrays for an interpolation, None when it has no colour
+def colorChannels(density, interpolation: str):
+    if interpolation == "l":
+        red = density / 100
+        blue = (100 - density) / 100
+    elif interpolation == "q":
+        red = (density / 100) ** 2  # quadratic interpolation
+        blue = 1 - red
+    else:
+        return None
+    return red, np.zeros(density.shape, dtype=int), blue
+
+
+# colour channels rounded to `count` levels, 256 being the sheet's 8 bit colour. green is
+# always 0 so only red and blue are kept
+def colorBuckets(channels, count: int = 256):
+    if channels is None:
+        return None
+    red, _, blue = channels
+    scale = count - 1
+    return np.stack([np.rint(red * scale), np.rint(blue * scale)])
+
+
+# what a state looks like on the sheet: the shown value and colour bucket of every cell.
+# frames with equal signatures look identical, so the second needs no update
+def displaySignature(sim, interpolation: str, data: str, color_buckets: int = 256):
+    channels = colorChannels(displayDensity(sim), interpolation)
+    return displayValues(sim, data), colorBuckets(channels, color_buckets)
+
+
+def sameSignature(signature, other):
+    (values, buckets), (other_values, other_buckets) = signature, other
+    if values.shape != other_values.shape or not np.array_equal(values, other_values):
+        return False
+    if buckets is None or other_buckets is None:
+        return buckets is other_buckets
+    return np.array_equal(buckets, other_buckets)
+
+
+# font_size None leaves the text format out, for bodies that set it once for the range
+def cellData(value, color: dict, font_size: int, value_key: str):
+    if font_size is None:
+        return {
+            "userEnteredFormat": {"backgroundColor": color},
+            "userEnteredValue": {value_key: value},
+        }
+    return {
+        "userEnteredFormat": {
+            "backgroundColor": color,
+            "textFormat": {"fontSize": font_size},
+        },
+        "userEnteredValue": {value_key: value},
+    }
+
+
+# rows is a list of lists of cell dicts, placed with its top left corner at (row, col)
+def updateCellsRequest(row: int, col: int, rows, fields: str, sheet_id: int = 0):
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": row,
+                "endRowIndex": row + len(rows),
+                "startColumnIndex": col,
+                "endColumnIndex": col + len(rows[0]),
+            },
+            "rows": [{"values": values} for values in rows],
+            "fields": fields,
+        }
+    }
+
+
+# cell dicts for the block [rows, cols] of a grid, built from precomputed value and colour
+# arrays so no per-cell branching on the display type is needed
+def cellBlock(values, channels, rows, cols, font_size: int, value_key: str):
+    values = values[rows, cols].tolist()
+    if channels is None:
+        colors = [[{} for _ in row] for row in values]
+    else:
+        red, green, blue = (channel[rows, cols].tolist() for channel in channels)
+        colors = [
+            [
+                {"red": r, "green": g, "blue": b}
+                for r, g, b in zip(red_row, green_row, blue_row)
+            ]
+            for red_row, green_row, blue_row in zip(red, green, blue)
+        ]
+    return [
+        [
+            cellData(value, color, font_size, value_key)
+            for value, color in zip(value_row, color_row)
+        ]
+        for value_row, color_row in zip(values, colors)
+    ]
+
+
+def fontSizeRequest(rows: int, cols: int, font_size: int, sheet_id: int = 0):
+    return {
+        "repeatCell": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": 0,
+                "endRowIndex": rows,
+                "startColumnIndex": 0,
+                "endColumnIndex": cols,
+            },
+            "cell": {"userEnteredFormat": {"textFormat": {"fontSize": font_size}}},
+            "fields": "userEnteredFormat.textFormat.fontSize",
+        }
+    }
+
+
+# the whole grid as one repeatCell for the font size plus one updateCells per band of
+# band_rows rows (one for the whole grid by default), instead of a request per cell.
+# color_digits rounds the colour channels, 3 digits is finer than the sheet's 8 bit colour
+def genGridBody(
+    sim,
+    interpolation: str = "l",
+    data: str = "d",
+    band_rows: int = None,
+    sheet_id: int = 0,
+    color_digits: int = None,
+):
+    rows, cols = sim.shape
+    band_rows = band_rows or rows
+    values = displayValues(sim, data)
+    channels = colorChannels(displayDensity(sim), interpolation)
+    if channels is not None and color_digits is not None:
+        channels = tuple(np.round(channel, color_digits) for channel in channels)
+    value_key = valueKey(data)
+    fields = cellFields(data, font=False)
+
+    requests = [fontSizeRequest(rows, cols, fontSize(data), sheet_id)]
+    for start in range(0, rows, band_rows):
+        band = slice(start, min(start + band_rows, rows))
+        cells = cellBlock(values, channels, band, slice(0, cols), None, value_key)
+        requests.append(updateCellsRequest(start, 0, cells, fields, sheet_id))
+    return {"requests": requests}, sim
@@ -0,0 +1,853 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+import utilityclasses.SpillTrace as SpillTrace
+
+# whole-array versions of the spill step in simulation.runSim. an engine takes the density,
+# ux and uy arrays of the current state and returns new arrays for the next state.
+
+# neighbour directions in the order runSim lists them: (x - 1), (x + 1), (y - 1), (y + 1)
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+# (source, target) index pairs for fluid flowing in each direction
+_SLICES = {
+    UP: ((..., slice(1, None), slice(None)), (..., slice(None, -1), slice(None))),
+    DOWN: ((..., slice(None, -1), slice(None)), (..., slice(1, None), slice(None))),
+    LEFT: ((..., slice(None), slice(1, None)), (..., slice(None), slice(None, -1))),
+    RIGHT: ((..., slice(None), slice(None, -1)), (..., slice(None), slice(1, None))),
+}
+
+# runSim visits cells row by row, so a cell first receives from the cell above it, then from
+# the cell to its left, then spills itself, then receives from the right and from below.
+# the velocity reweighting depends on this order, so the passes below follow it exactly.
+_RECEIVE_BEFORE_SPILL = (DOWN, RIGHT)
+_RECEIVE_AFTER_SPILL = (LEFT, UP)
+
+
+# float types a state can be stepped in. float64 is the default, float32 halves the memory
+# every pass reads and writes at about 7 significant digits
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+
+# the float type an engine steps arrays in: float32 arrays stay float32, everything else is
+# stepped in float64 as before
+def floatType(array):
+    return np.float32 if np.asarray(array).dtype == np.float32 else np.float64
+
+
+# total mass of a density array, summed in float64 whatever the state's precision
+def totalMass(densities):
+    return float(np.sum(densities, dtype=np.float64))
+
+
+# whether mass was conserved between two totals `steps` steps apart. float64 keeps
+# np.isclose's default tolerance, float32 rounds every update to 24 bits so its total may
+# wander by a few epsilon for every step in between
+def massConserved(before, after, dtype=np.float64, steps: int = 1):
+    rtol = max(1e-5, 8 * np.finfo(dtype).eps * steps)
+    return bool(np.isclose(before, after, rtol=rtol))
+
+
+# preallocated scratch arrays for stepNumpy, reusing one across steps of the same shape
+# means a step allocates nothing
+def workspace(shape, dtype=np.float64):
+    return {
+        "differences": np.zeros((4,) + tuple(shape), dtype=dtype),
+        "spills": np.empty((4,) + tuple(shape), dtype=dtype),
+        "total": np.empty(shape, dtype=dtype),
+        "max_spill": np.empty(shape, dtype=dtype),
+        "factors": np.empty(shape, dtype=dtype),
+        "moved_ux": np.empty(shape, dtype=dtype),
+        "moved_uy": np.empty(shape, dtype=dtype),
+        "term": np.empty(shape, dtype=dtype),
+        "active": np.empty(shape, dtype=bool),
+        "inactive": np.empty(shape, dtype=bool),
+        "flip": np.empty(shape, dtype=bool),
+        "flip_high": np.empty(shape, dtype=bool),
+        "moving": np.empty(shape, dtype=bool),
+    }
+
+
+def _spills(densities, ux, uy, work, geometry):
+    # amount each cell sends to each neighbour, 0 where there is no neighbour or no spill
+    max_spill = np.multiply(densities, 0.75, out=work["max_spill"])
+    differences = work["differences"]
+    for direction, (source, target) in _SLICES.items():
+        difference = differences[direction][source]
+        np.subtract(densities[source], densities[target], out=difference)
+        np.maximum(difference, 0, out=difference)
+    # land neighbours count like missing ones, adding their 0 doesn't change the total
+    if geometry["closed"] is not None:
+        np.copyto(differences, 0.0, where=_batched(geometry["closed"], densities))
+    # same summation order as the python sum over the neighbour list
+    total_difference = np.add(differences[UP], differences[DOWN], out=work["total"])
+    total_difference += differences[LEFT]
+    total_difference += differences[RIGHT]
+    active = np.greater(max_spill, 0, out=work["active"])
+    active &= np.greater(total_difference, 0, out=work["inactive"])
+
+    # in place, multiplication is commutative so the products round exactly like runSim's
+    spills = np.divide(differences, total_difference, out=work["spills"])
+    spills *= max_spill
+    spills *= 0.25
+    direction_factors = work["factors"]
+    for direction, combine, velocity in (
+        (UP, np.subtract, ux),
+        (DOWN, np.add, ux),
+        (LEFT, np.subtract, uy),
+        (RIGHT, np.add, uy),
+    ):
+        combine(1.0, velocity, out=direction_factors)
+        np.maximum(direction_factors, 0, out=direction_factors)
+        spills[direction] *= direction_factors
+    np.copyto(spills, 0.0, where=np.logical_not(active, out=work["inactive"]))
+    return spills, differences, active
+
+
+# the solid boundaries of a grid. open[d] marks cells that exchange fluid with their
+# neighbour in direction d: the neighbour exists and neither cell is land. the walls are
+# the reflection normals, (low_x, high_x, low_y, high_y) mark cells whose velocity is
+# reflected when it points at the grid edge or at land on that side. closed is None when
+# there is no land, so plain grids skip the masking
+@lru_cache(maxsize=16)
+def _geometry(shape, land_bytes: bytes = None):
+    rows, cols = shape
+    land = np.zeros(shape, dtype=bool)
+    if land_bytes is not None:
+        land = np.frombuffer(land_bytes, dtype=bool).reshape(shape)
+    water = ~land
+    open_ = np.zeros((4,) + shape, dtype=bool)
+    for direction, (source, target) in _SLICES.items():
+        open_[direction][source] = water[source] & water[target]
+    walls = tuple(np.ones(shape, dtype=bool) for _ in range(4))
+    low_x, high_x, low_y, high_y = walls
+    low_x[1:, :] = land[:-1, :]
+    high_x[:-1, :] = land[1:, :]
+    low_y[:, 1:] = land[:, :-1]
+    high_y[:, :-1] = land[:, 1:]
+    geometry = {
+        "land": land,
+        "open": open_,
+        "closed": None if land_bytes is None else ~open_,
+        "walls": walls,
+        "wall_stack": np.stack(walls),
+    }
+    for array in (land, open_, geometry["wall_stack"]) + walls:
+        array.flags.writeable = False
+    return geometry
+
+
+# the loop engine's per cell neighbour lists, in the order runSim lists them, and its walls
+# as lists. only stepLoop reads these, at large sizes they cost far more than the arrays
+@lru_cache(maxsize=16)
+def _loopGeometry(shape, land_bytes: bytes = None):
+    rows, cols = shape
+    grid = _geometry(shape, land_bytes)
+    offsets = ((-1, 0), (1, 0), (0, -1), (0, 1))
+    open_lists = grid["open"].tolist()
+    neighbors = [
+        [
+            [
+                (x + dx, y + dy)
+                for direction, (dx, dy) in enumerate(offsets)
+                if open_lists[direction][x][y]
+            ]
+            for y in range(cols)
+        ]
+        for x in range(rows)
+    ]
+    return {
+        "neighbors": neighbors,
+        "wall_lists": tuple(wall.tolist() for wall in grid["walls"]),
+    }
+
+
+# the last land mask looked up and its key. a run passes the same mask every step, comparing
+# it with the copy is much cheaper than building and hashing a new key
+_last_land = (None, None)
+
+
+def _geometryKey(shape, land):
+    global _last_land
+    shape = tuple(shape[-2:])
+    if land is None or not np.any(land):
+        return (shape,)
+    mask, key = _last_land
+    if mask is None or mask.shape != np.shape(land) or not np.array_equal(mask, land):
+        mask = np.array(land, dtype=bool)
+        key = mask.tobytes()
+        _last_land = (mask, key)
+    return shape, key
+
+
+# the geometry of a grid with an optional land mask, computed once per shape and mask
+def geometry(shape, land=None):
+    return _geometry(*_geometryKey(shape, land))
+
+
+# the list tables stepLoop walks, see _loopGeometry
+def loopGeometry(shape, land=None):
+    return _loopGeometry(*_geometryKey(shape, land))
+
+
+# the part of a geometry under a window, for stepping part of a grid
+def _windowGeometry(geometry, window):
+    closed = geometry["closed"]
+    return {
+        "land": geometry["land"][window],
+        "open": geometry["open"][(slice(None),) + window],
+        "closed": None if closed is None else closed[(slice(None),) + window],
+        "walls": tuple(wall[window] for wall in geometry["walls"]),
+    }
+
+
+# a (4, rows, cols) mask lined up with the (4, ..., rows, cols) spill arrays of a batch
+def _batched(mask, densities):
+    return mask.reshape(mask.shape[:1] + (1,) * (densities.ndim - 2) + mask.shape[1:])
+
+
+def _receive(
+    direction, densities, ux, uy, spills, differences, active, new_state, geometry, work
+):
+    new_densities, new_ux, new_uy = new_state
+    source, target = _SLICES[direction]
+    spill_amount = spills[direction][source]
+    moving = active[source]
+    if geometry["closed"] is not None:
+        # land never takes on a spilling neighbour's velocity
+        moving = np.logical_and(
+            moving,
+            _batched(geometry["open"], densities)[direction][source],
+            out=work["moving"][source],
+        )
+    moved_ux = work["moved_ux"][target]
+    moved_uy = work["moved_uy"][target]
+    term = work["term"][target]
+    flip = work["flip"][target]
+    flip_high = work["flip_high"][target]
+
+    new_densities[target] += spill_amount
+    dest_density = new_densities[target]
+
+    # transfer velocities along with the fluid
+    for moved, new_velocity, velocity in (
+        (moved_ux, new_ux, ux),
+        (moved_uy, new_uy, uy),
+    ):
+        np.multiply(new_velocity[target], densities[target], out=moved)
+        moved += np.multiply(velocity[source], spill_amount, out=term)
+        moved /= dest_density
+
+    # introduce velocity based on density difference
+    velocity_introduction = np.sqrt(differences[direction][source], out=term)
+    if direction == DOWN:
+        moved_ux += velocity_introduction
+    elif direction == UP:
+        moved_ux -= velocity_introduction
+    elif direction == RIGHT:
+        moved_uy += velocity_introduction
+    else:
+        moved_uy -= velocity_introduction
+
+    # handle cells next to walls by redirecting velocity
+    low_x, high_x, low_y, high_y = (wall[target[1:]] for wall in geometry["walls"])
+    for moved, low, high in ((moved_ux, low_x, high_x), (moved_uy, low_y, high_y)):
+        np.less(moved, 0, out=flip)
+        flip &= low
+        np.greater(moved, 0, out=flip_high)
+        flip_high &= high
+        flip |= flip_high
+        np.negative(moved, out=moved, where=flip)
+
+    np.copyto(new_ux[target], moved_ux, where=moving)
+    np.copyto(new_uy[target], moved_uy, where=moving)
+
+
+# trace is a SpillTrace that records every spill, verbose prints them after the step.
+# step stamps the recorded events, by default the number of steps the trace has seen
+def stepLoop(densities, ux, uy, verbose=False, land=None, trace=None, step=None):
+    # create a copy of the densities and velocities to update, float32 states are updated
+    # in float32 arrays so every write rounds like the other engines
+    dtype = floatType(densities)
+    new_densities = np.array(densities, dtype=dtype)
+    new_ux = np.array(ux, dtype=dtype)
+    new_uy = np.array(uy, dtype=dtype)
+    # read the current state from plain lists, element access on them is much cheaper
+    densities = new_densities.tolist()
+    ux = new_ux.tolist()
+    uy = new_uy.tolist()
+
+    rows, cols = new_densities.shape
+    # valid neighbours and walls only depend on the grid, they are looked up, not rebuilt
+    grid = loopGeometry(new_densities.shape, land)
+    neighbor_lists = grid["neighbors"]
+    low_x, high_x, low_y, high_y = grid["wall_lists"]
+    events = [] if trace is not None or verbose else None
+    if step is None:
+        step = trace.steps if trace is not None else 0
+    # distribute fluid
+    for x in range(rows):
+        for y in range(cols):
+            cur_density = densities[x][y]
+            cur_ux = ux[x][y]
+            cur_uy = uy[x][y]
+            max_spill = cur_density * 0.75
+            if max_spill > 0:
+                # calculate the amount to distribute to each neighbor, land is never one
+                neighbors = neighbor_lists[x][y]
+
+                total_difference = sum(
+                    max(cur_density - densities[nx][ny], 0) for nx, ny in neighbors
+                )
+                if total_difference > 0:
+                    for nx, ny in neighbors:
+                        difference = max(cur_density - densities[nx][ny], 0)
+                        direction_factor = 1.0
+                        if nx == x + 1:
+                            direction_factor += cur_ux
+                        elif nx == x - 1:
+                            direction_factor -= cur_ux
+                        if ny == y + 1:
+                            direction_factor += cur_uy
+                        elif ny == y - 1:
+                            direction_factor -= cur_uy
+                        direction_factor = max(
+                            direction_factor, 0
+                        )  # ensure non-negative
+
+                        spill_amount = (
+                            max_spill
+                            * (difference / total_difference)
+                            * 0.25
+                            * direction_factor
+                        )
+                        if events is not None:
+                            source_before = new_densities[x][y]
+                            dest_before = new_densities[nx][ny]
+                        new_densities[nx][ny] += spill_amount
+                        new_densities[x][y] -= spill_amount
+                        if events is not None:
+                            events.append(
+                                (
+                                    step,
+                                    x,
+                                    y,
+                                    nx,
+                                    ny,
+                                    spill_amount,
+                                    source_before,
+                                    dest_before,
+                                    new_densities[x][y],
+                                    new_densities[nx][ny],
+                                )
+                            )
+
+                        # transfer velocities along with the fluid
+                        new_ux[nx][ny] = (
+                            new_ux[nx][ny] * densities[nx][ny] + cur_ux * spill_amount
+                        ) / new_densities[nx][ny]
+                        new_uy[nx][ny] = (
+                            new_uy[nx][ny] * densities[nx][ny] + cur_uy * spill_amount
+                        ) / new_densities[nx][ny]
+
+                        # introduce velocity based on density difference (potential energy to kinetic energy conversion)
+                        velocity_introduction = math.sqrt(
+                            difference
+                        )  # simplified conversion
+                        if nx == x + 1:
+                            new_ux[nx][ny] += velocity_introduction
+                        elif nx == x - 1:
+                            new_ux[nx][ny] -= velocity_introduction
+                        if ny == y + 1:
+                            new_uy[nx][ny] += velocity_introduction
+                        elif ny == y - 1:
+                            new_uy[nx][ny] -= velocity_introduction
+
+                        # handle cells next to walls and land by redirecting velocity
+                        if low_x[nx][ny] and new_ux[nx][ny] < 0:
+                            new_ux[nx][ny] = -new_ux[nx][ny]
+                        elif high_x[nx][ny] and new_ux[nx][ny] > 0:
+                            new_ux[nx][ny] = -new_ux[nx][ny]
+                        if low_y[nx][ny] and new_uy[nx][ny] < 0:
+                            new_uy[nx][ny] = -new_uy[nx][ny]
+                        elif high_y[nx][ny] and new_uy[nx][ny] > 0:
+                            new_uy[nx][ny] = -new_uy[nx][ny]
+
+    if verbose and events:
+        print(SpillTrace.formatEvents(events))
+    if trace is not None:
+        trace.extend(events)
+    return new_densities, new_ux, new_uy
+
+
+# new_state fills the given (densities, ux, uy) arrays instead of returning new ones, and
+# work is a workspace() of the same shape. with both a step allocates no arrays. land is
+# an optional mask of cells that hold no fluid and reflect velocity like the grid edges
+def stepNumpy(densities, ux, uy, new_state=None, work=None, land=None):
+    return _stepGeometry(
+        densities, ux, uy, new_state, work, geometry(np.shape(densities), land)
+    )
+
+
+def _stepGeometry(densities, ux, uy, new_state, work, geometry):
+    dtype = floatType(densities)
+    densities = np.asarray(densities, dtype=dtype)
+    ux = np.asarray(ux, dtype=dtype)
+    uy = np.asarray(uy, dtype=dtype)
+    if new_state is None:
+        new_state = (densities.copy(), ux.copy(), uy.copy())
+    else:
+        for new, current in zip(new_state, (densities, ux, uy)):
+            np.copyto(new, current)
+    if work is None:
+        work = workspace(densities.shape, dtype)
+
+    # cells that do not spill divide by zero here, those results are masked out again
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spills, differences, active = _spills(densities, ux, uy, work, geometry)
+        args = (
+            densities,
+            ux,
+            uy,
+            spills,
+            differences,
+            active,
+            new_state,
+            geometry,
+            work,
+        )
+
+        for direction in _RECEIVE_BEFORE_SPILL:
+            _receive(direction, *args)
+        new_densities = new_state[0]
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            new_densities -= spills[direction]
+        for direction in _RECEIVE_AFTER_SPILL:
+            _receive(direction, *args)
+
+    return new_state
+
+
+def _spillKernel(densities, ux, uy, new_densities, new_ux, new_uy, open_, walls):
+    # the stepLoop update written without python objects so numba can compile it, with the
+    # neighbour lists and walls read from the geometry's open and wall_stack arrays
+    rows, cols = densities.shape
+    neighbors = np.empty((4, 2), dtype=np.int64)
+    for x in range(rows):
+        for y in range(cols):
+            cur_density = densities[x, y]
+            cur_ux = ux[x, y]
+            cur_uy = uy[x, y]
+            max_spill = cur_density * 0.75
+            if not max_spill > 0:
+                continue
+            count = 0
+            if open_[0, x, y]:
+                neighbors[count, 0] = x - 1
+                neighbors[count, 1] = y
+                count += 1
+            if open_[1, x, y]:
+                neighbors[count, 0] = x + 1
+                neighbors[count, 1] = y
+                count += 1
+            if open_[2, x, y]:
+                neighbors[count, 0] = x
+                neighbors[count, 1] = y - 1
+                count += 1
+            if open_[3, x, y]:
+                neighbors[count, 0] = x
+                neighbors[count, 1] = y + 1
+                count += 1
+
+            total_difference = 0.0
+            for k in range(count):
+                total_difference += max(
+                    cur_density - densities[neighbors[k, 0], neighbors[k, 1]], 0.0
+                )
+            if not total_difference > 0:
+                continue
+
+            for k in range(count):
+                nx = neighbors[k, 0]
+                ny = neighbors[k, 1]
+                difference = max(cur_density - densities[nx, ny], 0.0)
+                direction_factor = 1.0
+                if nx == x + 1:
+                    direction_factor += cur_ux
+                elif nx == x - 1:
+                    direction_factor -= cur_ux
+                if ny == y + 1:
+                    direction_factor += cur_uy
+                elif ny == y - 1:
+                    direction_factor -= cur_uy
+                direction_factor = max(direction_factor, 0.0)
+
+                spill_amount = (
+                    max_spill
+                    * (difference / total_difference)
+                    * 0.25
+                    * direction_factor
+                )
+                new_densities[nx, ny] += spill_amount
+                new_densities[x, y] -= spill_amount
+
+                new_ux[nx, ny] = (
+                    new_ux[nx, ny] * densities[nx, ny] + cur_ux * spill_amount
+                ) / new_densities[nx, ny]
+                new_uy[nx, ny] = (
+                    new_uy[nx, ny] * densities[nx, ny] + cur_uy * spill_amount
+                ) / new_densities[nx, ny]
+
+                velocity_introduction = np.sqrt(difference)
+                if nx == x + 1:
+                    new_ux[nx, ny] += velocity_introduction
+                elif nx == x - 1:
+                    new_ux[nx, ny] -= velocity_introduction
+                if ny == y + 1:
+                    new_uy[nx, ny] += velocity_introduction
+                elif ny == y - 1:
+                    new_uy[nx, ny] -= velocity_introduction
+
+                if walls[0, nx, ny] and new_ux[nx, ny] < 0:
+                    new_ux[nx, ny] = -new_ux[nx, ny]
+                elif walls[1, nx, ny] and new_ux[nx, ny] > 0:
+                    new_ux[nx, ny] = -new_ux[nx, ny]
+                if walls[2, nx, ny] and new_uy[nx, ny] < 0:
+                    new_uy[nx, ny] = -new_uy[nx, ny]
+                elif walls[3, nx, ny] and new_uy[nx, ny] > 0:
+                    new_uy[nx, ny] = -new_uy[nx, ny]
+
+
+_compiled_kernel = None
+
+
+# numba takes a while to import, so it is only loaded the first time the numba engine runs.
+# cache=True stores the compiled kernel next to this file, so only the first process pays
+# for compilation. error_model="numpy" divides by zero like the loop instead of raising
+def _numbaKernel():
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        try:
+            from numba import njit
+        except ImportError:  # the numba engine falls back to stepNumpy
+            _compiled_kernel = False
+        else:
+            _compiled_kernel = njit(cache=True, error_model="numpy")(_spillKernel)
+    return _compiled_kernel
+
+
+# the kernel needs no scratch arrays, work is only accepted to match stepNumpy
+def stepNumba(densities, ux, uy, new_state=None, work=None, land=None):
+    kernel = _numbaKernel()
+    if not kernel:
+        return stepNumpy(densities, ux, uy, new_state, work, land)
+    dtype = floatType(densities)
+    densities = np.ascontiguousarray(densities, dtype=dtype)
+    ux = np.ascontiguousarray(ux, dtype=dtype)
+    uy = np.ascontiguousarray(uy, dtype=dtype)
+    if new_state is None:
+        new_state = (densities.copy(), ux.copy(), uy.copy())
+    else:
+        for new, current in zip(new_state, (densities, ux, uy)):
+            np.copyto(new, current)
+    grid = geometry(densities.shape, land)
+    kernel(densities, ux, uy, *new_state, grid["open"], grid["wall_stack"])
+    return new_state
+
+
+# cells read around a window stepped on its own, for the same reason as StripStepper.HALO:
+# a cell's update depends on its neighbours' spills, which depend on their neighbours
+ACTIVE_HALO = 2
+
+
+# (rows, col_start, col_stop) in cells for each run of consecutive active tiles in a row
+# of tiles. a tile is active when it or a neighbouring tile has fluid in it, since only
+# cells with density spill and fluid moves at most one cell per step
+def activeWindows(densities, tile: int = 32):
+    rows, cols = densities.shape
+    tile_rows, tile_cols = -(-rows // tile), -(-cols // tile)
+    wet = np.zeros((tile_rows * tile, tile_cols * tile), dtype=bool)
+    np.greater(densities, 0, out=wet[:rows, :cols])
+    tiles = wet.reshape(tile_rows, tile, tile_cols, tile).any(axis=(1, 3))
+    active = tiles.copy()
+    active[1:] |= tiles[:-1]
+    active[:-1] |= tiles[1:]
+    near = active.copy()
+    active[:, 1:] |= near[:, :-1]
+    active[:, :-1] |= near[:, 1:]
+
+    windows = []
+    for tile_row, row in enumerate(active):
+        edges = np.diff(np.concatenate(([0], row.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        stops = np.flatnonzero(edges == -1)
+        row_slice = slice(tile_row * tile, min((tile_row + 1) * tile, rows))
+        for start, stop in zip(starts, stops):
+            windows.append((row_slice, start * tile, min(stop * tile, cols)))
+    return windows
+
+
+# steps only the tiles around cells with fluid in them, so the cost scales with the wet
+# area instead of the grid. every run of active tiles is stepped on a window with a halo
+# that is thrown away, which reproduces the full step exactly
+def stepActive(densities, ux, uy, new_state=None, work=None, land=None, tile: int = 32):
+    dtype = floatType(densities)
+    densities = np.asarray(densities, dtype=dtype)
+    ux = np.asarray(ux, dtype=dtype)
+    uy = np.asarray(uy, dtype=dtype)
+    if new_state is None:
+        new_state = (densities.copy(), ux.copy(), uy.copy())
+    else:
+        for new, current in zip(new_state, (densities, ux, uy)):
+            np.copyto(new, current)
+    rows, cols = densities.shape
+    grid = geometry(densities.shape, land)
+    for row_slice, col_start, col_stop in activeWindows(densities, tile):
+        top = max(row_slice.start - ACTIVE_HALO, 0)
+        bottom = min(row_slice.stop + ACTIVE_HALO, rows)
+        left = max(col_start - ACTIVE_HALO, 0)
+        right = min(col_stop + ACTIVE_HALO, cols)
+        window = (slice(top, bottom), slice(left, right))
+        core = (
+            slice(row_slice.start - top, row_slice.stop - top),
+            slice(col_start - left, col_stop - left),
+        )
+        stepped = _stepGeometry(
+            densities[window],
+            ux[window],
+            uy[window],
+            None,
+            None,
+            _windowGeometry(grid, window),
+        )
+        for new, new_window in zip(new_state, stepped):
+            new[row_slice, col_start:col_stop] = new_window[core]
+    return new_state
+
+
+# stable fluids (Stam 1999): a different model from the spill rule, where density is carried
+# by an incompressible velocity field instead of spilling down its own gradient. every pass
+# is unconditionally stable, so dt can be many times the spill step's. density diffuses,
+# sinks along x with buoyancy and is advected; velocity is advected along itself and
+# projected to be divergence free, with no flow through the grid edges or land
+STABLE_DT = 1.0
+STABLE_DIFFUSION = 0.05
+STABLE_VISCOSITY = 0.0
+STABLE_BUOYANCY = 0.01
+# relative residual and iteration cap of the conjugate gradient solves used around land
+STABLE_TOLERANCE = 1e-6
+STABLE_ITERATIONS = 200
+
+
+# eigenvalues of the 5 point laplacian with walls at the edges, laid out like the rfft2 of a
+# grid mirrored to twice its size in both directions
+@lru_cache(maxsize=16)
+def _laplacianEigenvalues(shape):
+    rows, cols = shape
+    row_values = 2 * np.cos(np.pi * np.arange(2 * rows) / rows) - 2
+    col_values = 2 * np.cos(np.pi * np.arange(cols + 1) / cols) - 2
+    eigenvalues = row_values[:, None] + col_values[None, :]
+    eigenvalues.flags.writeable = False
+    return eigenvalues
+
+
+# solves (alpha - laplacian) x = rhs on a grid with walls at its edges. mirroring the grid
+# makes it periodic without changing the wall condition, so the fft diagonalises the
+# laplacian (a dct-ii done with an fft). alpha 0 is the pressure solve, which is only
+# defined up to a constant, the mean is left at 0
+def _solveWalls(rhs, alpha: float):
+    rows, cols = rhs.shape
+    mirrored = np.empty((2 * rows, 2 * cols), dtype=rhs.dtype)
+    mirrored[:rows, :cols] = rhs
+    mirrored[rows:, :cols] = rhs[::-1]
+    mirrored[:, cols:] = mirrored[:, cols - 1 :: -1]
+    spectrum = np.fft.rfft2(mirrored)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spectrum /= alpha - _laplacianEigenvalues(rhs.shape)
+    if alpha == 0:
+        spectrum[0, 0] = 0
+    return np.fft.irfft2(spectrum, s=mirrored.shape)[:rows, :cols].astype(rhs.dtype)
+
+
+# sum over the open neighbours of every cell of (neighbour - cell), 0 on land
+def _laplacian(values, open_):
+    result = np.zeros_like(values)
+    for direction, (source, target) in _SLICES.items():
+        result[source] += open_[direction][source] * (values[target] - values[source])
+    return result
+
+
+# (alpha - laplacian) x = rhs over the water cells. without land the fft solve is exact,
+# around land conjugate gradients run with that solve as the preconditioner, which leaves
+# only the land's own effect for the iterations to resolve
+def _solve(rhs, alpha: float, geometry):
+    if geometry["closed"] is None:
+        return _solveWalls(rhs, alpha)
+    open_ = geometry["open"]
+    water = ~geometry["land"]
+
+    def precondition(residual):
+        return _solveWalls(residual, alpha) * water
+
+    x = np.zeros_like(rhs)
+    residual = rhs * water
+    target = STABLE_TOLERANCE * np.linalg.norm(residual)
+    z = precondition(residual)
+    direction = z.copy()
+    rz = np.vdot(residual, z)
+    for _ in range(STABLE_ITERATIONS):
+        if np.linalg.norm(residual) <= target or rz == 0:
+            break
+        applied = alpha * direction - _laplacian(direction, open_)
+        step = rz / np.vdot(direction, applied)
+        x += step * direction
+        residual -= step * applied
+        z = precondition(residual)
+        rz, previous = np.vdot(residual, z), rz
+        direction = z + (rz / previous) * direction
+    return x
+
+
+# face velocities with the divergence removed. the cell velocities are averaged onto the
+# faces between cells, face_x[i] carrying flow from row i to i + 1 and face_y[:, j] from
+# column j to j + 1. faces to the grid edges and land carry nothing, and the pressure
+# gradient that cancels the faces' divergence is subtracted from them
+def _projectFaces(ux, uy, geometry):
+    open_ = geometry["open"]
+    face_x = 0.5 * (ux[:-1] + ux[1:]) * open_[DOWN][:-1]
+    face_y = 0.5 * (uy[:, :-1] + uy[:, 1:]) * open_[RIGHT][:, :-1]
+    divergence = np.zeros_like(ux)
+    divergence[:-1] += face_x
+    divergence[1:] -= face_x
+    divergence[:, :-1] += face_y
+    divergence[:, 1:] -= face_y
+    pressure = _solve(-divergence, 0.0, geometry)
+    face_x -= (pressure[1:] - pressure[:-1]) * open_[DOWN][:-1]
+    face_y -= (pressure[:, 1:] - pressure[:, :-1]) * open_[RIGHT][:, :-1]
+    return face_x, face_y
+
+
+# cell velocities averaged back from the faces on either side
+def _cellVelocities(face_x, face_y):
+    rows, cols = face_x.shape[0] + 1, face_y.shape[1] + 1
+    ux = np.zeros((rows, cols), dtype=face_x.dtype)
+    uy = np.zeros((rows, cols), dtype=face_y.dtype)
+    ux[:-1] += face_x
+    ux[1:] += face_x
+    uy[:, :-1] += face_y
+    uy[:, 1:] += face_y
+    return 0.5 * ux, 0.5 * uy
+
+
+# every field sampled where the flow through each cell was dt ago, interpolating bilinearly
+# between cells and clamping at the grid edges
+def _advect(fields, ux, uy, dt: float):
+    rows, cols = ux.shape
+    x = np.clip(np.arange(rows)[:, None] - dt * ux, 0, rows - 1)
+    y = np.clip(np.arange(cols)[None, :] - dt * uy, 0, cols - 1)
+    x0 = np.minimum(x.astype(np.intp), max(rows - 2, 0))
+    y0 = np.minimum(y.astype(np.intp), max(cols - 2, 0))
+    x1 = np.minimum(x0 + 1, rows - 1)
+    y1 = np.minimum(y0 + 1, cols - 1)
+    tx = (x - x0).astype(ux.dtype)
+    ty = (y - y0).astype(ux.dtype)
+    return tuple(
+        (1 - tx) * ((1 - ty) * field[x0, y0] + ty * field[x0, y1])
+        + tx * ((1 - ty) * field[x1, y0] + ty * field[x1, y1])
+        for field in fields
+    )
+
+
+# density moved across the faces by upwind fluxes, so whatever leaves one cell arrives in
+# its neighbour and the mass is conserved exactly. the faces are divergence free, so a new
+# cell is a weighted average of itself and its upwind neighbours and never exceeds the old
+# maximum, as long as no cell sends out more than it holds. dt is split into as many
+# sub-steps as that takes
+def _transport(densities, face_x, face_y, dt: float):
+    outflow = np.zeros_like(densities)
+    outflow[:-1] += np.maximum(face_x, 0)
+    outflow[1:] -= np.minimum(face_x, 0)
+    outflow[:, :-1] += np.maximum(face_y, 0)
+    outflow[:, 1:] -= np.minimum(face_y, 0)
+    substeps = max(1, int(np.ceil(dt * outflow.max(initial=0))))
+    h = dt / substeps
+    densities = densities.copy()
+    for _ in range(substeps):
+        flux_x = h * face_x * np.where(face_x > 0, densities[:-1], densities[1:])
+        flux_y = h * face_y * np.where(face_y > 0, densities[:, :-1], densities[:, 1:])
+        densities[:-1] -= flux_x
+        densities[1:] += flux_x
+        densities[:, :-1] -= flux_y
+        densities[:, 1:] += flux_y
+    return densities
+
+
+# a stable fluids step of dt. unlike the spill engines the velocities are part of the state
+# and have to be carried from one step to the next. velocity is advected semi-Lagrangian,
+# density is transported conservatively across the projected faces, so only rounding and
+# the clamp at 0 are left for the rescale at the end to restore. a larger loss is left in
+# place for runSim's conservation check to catch. work is only accepted to match stepNumpy
+def stepStable(
+    densities,
+    ux,
+    uy,
+    new_state=None,
+    work=None,
+    land=None,
+    dt: float = STABLE_DT,
+    diffusion: float = STABLE_DIFFUSION,
+    viscosity: float = STABLE_VISCOSITY,
+    buoyancy: float = STABLE_BUOYANCY,
+):
+    dtype = floatType(densities)
+    densities = np.asarray(densities, dtype=dtype)
+    ux = np.asarray(ux, dtype=dtype)
+    uy = np.asarray(uy, dtype=dtype)
+    grid = geometry(densities.shape, land)
+    water = ~grid["land"]
+    mass = totalMass(densities)
+
+    new_ux = (ux + dt * buoyancy * densities) * water
+    new_uy = uy * water
+    if viscosity > 0:
+        alpha = 1 / (dt * viscosity)
+        new_ux = _solve(alpha * new_ux, alpha, grid)
+        new_uy = _solve(alpha * new_uy, alpha, grid)
+    new_ux, new_uy = _cellVelocities(*_projectFaces(new_ux, new_uy, grid))
+    new_ux, new_uy = _advect((new_ux, new_uy), new_ux, new_uy, dt)
+    faces = _projectFaces(new_ux * water, new_uy * water, grid)
+    new_ux, new_uy = _cellVelocities(*faces)
+
+    new_densities = densities
+    if diffusion > 0:
+        alpha = 1 / (dt * diffusion)
+        new_densities = _solve(alpha * densities, alpha, grid)
+    new_densities = _transport(new_densities, *faces, dt)
+    new_densities = np.maximum(new_densities, 0) * water
+    new_mass = totalMass(new_densities)
+    if new_mass > 0 and massConserved(mass, new_mass, dtype):
+        new_densities *= mass / new_mass
+
+    result = tuple(
+        field.astype(dtype, copy=False) for field in (new_densities, new_ux, new_uy)
+    )
+    if new_state is None:
+        return result
+    for new, field in zip(new_state, result):
+        np.copyto(new, field)
+    return new_state
+
+
+ENGINES = {
+    "loop": stepLoop,
+    "numpy": stepNumpy,
+    "numba": stepNumba,
+    "active": stepActive,
+    "stable": stepStable,
+}
+
+# engines whose velocities carry over between steps. the spill engines start every step
+# from rest, see simulation.runSim
+CARRIES_VELOCITY = ("stable",)
@@ -0,0 +1,79 @@
+import numpy as np
+
+import engines
+import simulation
+import utilityclasses.SimArray as SimArray
+
+# per-member reductions that can be collected instead of full snapshots
+REDUCTIONS = simulation.REDUCTIONS
+
+
+# every test grid id, plus `perturbations` noisy copies of each one
+def testGridEnsemble(
+    grid_ids=range(1, 8), perturbations: int = 0, scale: float = 1.0, seed: int = 0
+):
+    rng = np.random.default_rng(seed)
+    members = []
+    for grid_id in grid_ids:
+        base = simulation.genTestGrid(grid_id).density
+        members.append(base)
+        for _ in range(perturbations):
+            noise = rng.uniform(0, scale, base.shape)
+            members.append(np.maximum(base + noise, 0))
+    return members
+
+
+def stackGrids(grids):
+    # grids may be SimArrays, nested lists or arrays, but all need the same shape. lists and
+    # arrays are read like SimArray reads them, so a cell marked 1 is a full cell of 100
+    return np.stack(
+        [
+            (
+                grid.density
+                if isinstance(grid, SimArray.SimArray)
+                else SimArray.SimArray(grid).density
+            )
+            for grid in grids
+        ]
+    )
+
+
+def stepEnsemble(densities, engine: str = "numpy"):
+    # one runSim step for every member of a (B, H, W) stack, starting each from rest
+    rest = np.zeros(densities.shape)
+    if engine == "numpy":
+        new_state = engines.stepNumpy(densities, rest, rest)
+    else:
+        step = engines.ENGINES[engine]
+        new_state = tuple(
+            np.stack(field)
+            for field in zip(
+                *(step(member, r, r) for member, r in zip(densities, rest))
+            )
+        )
+    assert np.allclose(
+        densities.sum(axis=(-2, -1)), new_state[0].sum(axis=(-2, -1))
+    ), "Density is not conserved!"
+    return new_state
+
+
+# advances all grids together and returns either a (density, ux, uy) snapshot of the whole
+# stack every `every` steps, or a dict of per-member reductions with shape (frames, B)
+def runEnsemble(
+    grids, steps: int, every: int = 1, reductions=None, engine: str = "numpy"
+):
+    densities = stackGrids(grids)
+    ux = uy = np.zeros(densities.shape)
+    snapshots = []
+    reduced = {name: [] for name in reductions or ()}
+    for step in range(1, steps + 1):
+        densities, ux, uy = stepEnsemble(densities, engine)
+        if step % every:
+            continue
+        if reductions is None:
+            snapshots.append((densities, ux, uy))
+        for name in reduced:
+            reduced[name].append(REDUCTIONS[name](densities, ux, uy))
+    if reductions is None:
+        return snapshots
+    return {name: np.array(values) for name, values in reduced.items()}
@@ -0,0 +1,68 @@
+import numpy as np
+
+import utilityclasses.SimArray as SimArray
+
+# level of detail for grids larger than the sheet: a state is reduced to a display sized
+# SimArray of block averaged tiles before it is encoded, so the cost of publishing depends on
+# the display size and not on the simulation size. every encoder and the renderer take the
+# reduced state like any other grid
+
+DISPLAY_SHAPE = (40, 40)
+
+
+# block boundaries splitting size cells into count blocks whose sizes differ by at most one
+def blockEdges(size: int, count: int):
+    return np.arange(count + 1) * size // count
+
+
+# sum of every block between consecutive row and column edges
+def blockSums(array, row_edges, col_edges):
+    sums = np.add.reduceat(array, row_edges[:-1], axis=0)
+    return np.add.reduceat(sums, col_edges[:-1], axis=1)
+
+
+# the cells of a grid under window, (row slice, col slice), at most display cells across.
+# a window that fits the display is shown at full resolution, a larger one is averaged over
+# blocks of cells. tiles average density and velocity over their water cells, and only
+# tiles without any water are land, so a coast doesn't dilute the fluid next to it
+def downsample(sim, display=DISPLAY_SHAPE, window=None):
+    if window is not None:
+        sim = SimArray.SimArray.fromArrays(
+            sim.density[window], sim.ux[window], sim.uy[window], sim.land[window]
+        )
+    rows, cols = sim.shape
+    shape = (min(rows, display[0]), min(cols, display[1]))
+    if shape == (rows, cols):
+        return sim
+    row_edges, col_edges = blockEdges(rows, shape[0]), blockEdges(cols, shape[1])
+    fields = (sim.density, sim.ux, sim.uy)
+    water = ~sim.land
+    if sim.land.any():
+        fields = tuple(np.where(water, field, 0) for field in fields)
+    counts = blockSums(water.astype(float), row_edges, col_edges)
+    land = counts == 0
+    scale = 1 / np.where(land, 1, counts)
+    return SimArray.SimArray.fromArrays(
+        *(blockSums(field, row_edges, col_edges) * scale for field in fields), land
+    )
+
+
+# a display sized window of full resolution cells centred on (row, col) as far as the grid
+# allows. zoom > 1 widens it to zoom * display cells, which downsample averages back down
+def zoomWindow(shape, center, display=DISPLAY_SHAPE, zoom: float = 1):
+    window = []
+    for size, middle, span in zip(shape, center, display):
+        span = min(size, max(1, round(span * zoom)))
+        start = min(max(middle - span // 2, 0), size - span)
+        window.append(slice(start, start + span))
+    return tuple(window)
+
+
+# window moved by (rows, cols) cells, stopping at the edges of the grid
+def panWindow(window, shape, rows: int = 0, cols: int = 0):
+    moved = []
+    for part, size, offset in zip(window, shape, (rows, cols)):
+        span = part.stop - part.start
+        start = min(max(part.start + offset, 0), size - span)
+        moved.append(slice(start, start + span))
+    return tuple(moved)
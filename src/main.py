@@ -1,17 +1,11 @@
+import importlib
 import os.path
-import tkinter as tk
-
-from tkinter import ttk
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import src.simulation as sim
+import src.sheetsclient as sheetsclient
 
 prototypes = {
     "p2": "src.Prototypes.Prototype2",
@@ -24,8 +18,17 @@ prototypes = {
 
 availableSimulations = ["c", "p4", "p5", "p6", "p7"]
 
-for key, module in prototypes.items():
-    globals()[key] = __import__(module, fromlist=["main"])
+
+# prototypes are only imported once chosen, and the current simulation runs instead of
+# one that isn't in this checkout
+def load_simulation(choice):
+    if choice not in prototypes:
+        return sim
+    try:
+        return importlib.import_module(prototypes[choice])
+    except ImportError:
+        print(f"Prototype {choice} is not available, running the current simulation")
+        return sim
 
 
 # If modifying these scopes, delete the file token.json.
@@ -33,20 +36,25 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
-# The ID and range of a sample spreadsheet.
+# The ID and range of a sample spreadsheet. The prototypes are fixed to 40x40, the current
+# simulation is given None and generates its range from the grid shape.
 SPREADSHEET_ID = "1NapEbwM5uHI1JoR1sZo8Qzd5WGt84tHy3jl_P5IljRM"
 GRID_RANGE = "Grid!A1:AN40"
-print(f"Using range: {GRID_RANGE}")
 
 
 def main():
+    # tkinter and the google client are imported here, so the headless cli never loads them
+    import tkinter as tk
+    from tkinter import ttk
+    from googleapiclient.errors import HttpError
+
     def show_settings_window():
         def submit_settings():
             nonlocal testGridID, dataDisplayType, colorInterpolation, verboseFlag, SIMULATION_CHOICE
             testGridID = int(testGridID_var.get())
             dataDisplayType = dataDisplayType_var.get()
             colorInterpolation = colorInterpolation_var.get()
-            verboseFlag = verboseFlag_var.get() == "True"
+            verboseFlag = verboseFlag_var.get()
             SIMULATION_CHOICE = simulationChoice_var.get()
             settings_window.destroy()
 
@@ -82,7 +90,7 @@ def main():
         tk.Label(settings_window, text="Verbose:").grid(
             row=3, column=0, padx=10, pady=5
         )
-        verboseFlag_var = tk.BooleanVar(value=True)
+        verboseFlag_var = tk.BooleanVar(value=False)
         tk.Checkbutton(
             settings_window, text="Verbose", variable=verboseFlag_var
         ).grid(row=3, column=1, padx=10, pady=5)
@@ -108,91 +116,30 @@ def main():
     testGridID = 7
     dataDisplayType = "v"
     colorInterpolation = "l"
-    verboseFlag = True
+    verboseFlag = False
     SIMULATION_CHOICE = "p6"
 
     # show settings window
     show_settings_window()
 
-    creds = None
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+    creds = sheetsclient.loadCredentials(SCOPES)
 
     # TEST_GRID_ID: int = 7,
     # DATA_DISPLAY_TYPE: str = "v",
     # COLOR_INTERPOLATION: str = "l",
-    # VERBOSE_VAL: bool = True
+    # VERBOSE_VAL: bool = False
 
+    simulation = load_simulation(SIMULATION_CHOICE)
     try:
-        match SIMULATION_CHOICE:
-            case "c":
-                sim.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
-            case "p4":
-                p4.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
-            case "p5":
-                p5.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
-            case "p6":
-                p6.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
-            case "p7":
-                p7.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
-            case _:
-                sim.main(
-                    creds,
-                    SPREADSHEET_ID,
-                    GRID_RANGE,
-                    TEST_GRID_ID=testGridID,
-                    DATA_DISPLAY_TYPE=dataDisplayType,
-                    COLOR_INTERPOLATION=colorInterpolation,
-                    VERBOSE_VAL=verboseFlag,
-                )
+        simulation.main(
+            creds,
+            SPREADSHEET_ID,
+            None if simulation is sim else GRID_RANGE,
+            TEST_GRID_ID=testGridID,
+            DATA_DISPLAY_TYPE=dataDisplayType,
+            COLOR_INTERPOLATION=colorInterpolation,
+            VERBOSE_VAL=verboseFlag,
+        )
     except HttpError as err:
         print(err)
 
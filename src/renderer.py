@@ -0,0 +1,147 @@
+from functools import lru_cache
+
+import numpy as np
+
+import encoders
+import simulation
+import utilityclasses.FrameWriter as FrameWriter
+import utilityclasses.Trajectory as Trajectory
+
+# renders simulation states to rgb images locally, as an alternative to publishing them to
+# the sheet. cells are drawn as scale x scale blocks in the sheet's background colour, and
+# the "v" display draws the sheet's arrow glyphs on top
+
+GLYPH_COLOR = (0, 0, 0)
+LAND_COLOR = (139, 69, 19)
+
+# arrow glyphs need a few pixels per cell to be readable
+MIN_GLYPH_SCALE = 5
+
+# (right, down) on screen for each glyph in encoders.ARROWS
+_ARROW_DIRECTIONS = [
+    (1, -1),
+    (-1, -1),
+    (1, 1),
+    (-1, 1),
+    (1, 0),
+    (-1, 0),
+    (0, -1),
+    (0, 1),
+]
+
+
+# scale that makes the longer side of the grid about `target` pixels
+def defaultScale(shape, target: int = 320):
+    return max(1, target // max(shape))
+
+
+def _lineMask(mask, start, end):
+    size = mask.shape[0]
+    points = np.linspace(start, end, 2 * size)
+    cols, rows = np.clip(np.rint(points), 0, size - 1).astype(int).T
+    mask[rows, cols] = True
+
+
+# (len(ARROWS) + 1, scale, scale) bool masks, one per arrow and a dot for still fluid
+@lru_cache
+def glyphMasks(scale: int):
+    masks = np.zeros((len(encoders.ARROWS) + 1, scale, scale), dtype=bool)
+    center = (scale - 1) / 2
+    length = 0.35 * (scale - 1)
+    for mask, (right, down) in zip(masks, _ARROW_DIRECTIONS):
+        direction = np.array([right, down]) / np.hypot(right, down)
+        tip = center + direction * length
+        _lineMask(mask, center - direction * length, tip)
+        # two barbs at 45 degrees either side of the shaft
+        for side in (1, -1):
+            barb = np.array(
+                [
+                    -direction[0] + side * direction[1],
+                    -direction[1] - side * direction[0],
+                ]
+            )
+            _lineMask(mask, tip, tip + barb / np.sqrt(2) * length * 0.6)
+    dot = max(1, scale // 5)
+    start = (scale - dot) // 2
+    masks[-1, start : start + dot, start : start + dot] = True
+    return masks
+
+
+# (rows, cols, 3) uint8 background colours, white where the interpolation has no colour
+def colorImage(density, interpolation: str = "l"):
+    channels = encoders.colorChannels(density, interpolation)
+    if channels is None:
+        return np.full(density.shape + (3,), 255, dtype=np.uint8)
+    image = np.empty(density.shape + (3,), dtype=np.uint8)
+    for i, channel in enumerate(channels):
+        image[..., i] = np.rint(np.clip(channel, 0, 1) * 255)
+    return image
+
+
+def upscale(image, scale: int):
+    if scale == 1:
+        return image
+    rows, cols, depth = image.shape
+    blocks = np.broadcast_to(
+        image[:, None, :, None, :], (rows, scale, cols, scale, depth)
+    )
+    return blocks.reshape(rows * scale, cols * scale, depth)
+
+
+# draws the glyph for every cell of `index` (encoders.arrowIndex) into an upscaled image
+def drawGlyphs(image, index, scale: int, color=GLYPH_COLOR):
+    rows, cols = index.shape
+    mask = glyphMasks(scale)[index].transpose(0, 2, 1, 3)
+    image[mask.reshape(rows * scale, cols * scale)] = color
+    return image
+
+
+def renderFrame(sim, interpolation: str = "l", data: str = "d", scale: int = None):
+    scale = scale or defaultScale(sim.shape)
+    colors = colorImage(encoders.displayDensity(sim), interpolation)
+    colors[sim.land] = LAND_COLOR
+    image = upscale(colors, scale)
+    if data == "v" and scale >= MIN_GLYPH_SCALE:
+        drawGlyphs(image, encoders.arrowIndex(sim.ux, sim.uy), scale)
+    return image
+
+
+# runs the simulation without a sheet and writes a frame every `every` steps to output, a
+# directory or file pattern for pngs or a video file name for ffmpeg. returns the last state
+def renderSimulation(
+    grid,
+    steps: int,
+    output: str,
+    interpolation: str = "l",
+    data: str = "d",
+    scale: int = None,
+    engine: str = "numpy",
+    every: int = 1,
+    fps: int = 30,
+):
+    sim = grid
+    with FrameWriter.FrameWriter(output, fps) as writer:
+        writer.write(renderFrame(sim, interpolation, data, scale))
+        for step in range(1, steps + 1):
+            sim = simulation.runSim(sim, engine=engine)
+            if step % every == 0:
+                writer.write(renderFrame(sim, interpolation, data, scale))
+    return sim
+
+
+# renders the frames saved in a trajectory file without re-simulating them
+def renderTrajectory(
+    path: str,
+    output: str,
+    interpolation: str = "l",
+    data: str = "d",
+    scale: int = None,
+    every: int = 1,
+    fps: int = 30,
+):
+    with Trajectory.Trajectory(path) as trajectory, FrameWriter.FrameWriter(
+        output, fps
+    ) as writer:
+        for index in range(0, len(trajectory), every):
+            writer.write(renderFrame(trajectory[index], interpolation, data, scale))
+        return writer.frames
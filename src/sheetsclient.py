@@ -0,0 +1,94 @@
+import os
+import random
+import time
+
+import utilityclasses.TokenBucket as TokenBucket
+
+# write requests the Sheets API allows per minute for one user of a project
+WRITE_REQUESTS_PER_MINUTE = 60
+
+# statuses worth retrying: quota exceeded and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def statusOf(err):
+    # HttpError keeps the status on its http response, the fake service does the same
+    resp = getattr(err, "resp", None)
+    status = getattr(resp, "status", None)
+    return int(status) if status is not None else None
+
+
+def isRetryable(err):
+    return statusOf(err) in RETRY_STATUSES
+
+
+# exponential backoff with full jitter: a random delay up to base * 2^attempt seconds
+def backoffDelay(attempt: int, base: float = 1.0, cap: float = 32.0, rng=random.random):
+    return rng() * min(cap, base * 2**attempt)
+
+
+def sheetsLimiter(
+    per_minute: int = WRITE_REQUESTS_PER_MINUTE,
+    burst: int = 5,
+    clock=time.monotonic,
+    sleep=time.sleep,
+):
+    return TokenBucket.TokenBucket(per_minute / 60, burst, clock, sleep)
+
+
+# calls send(body), waiting for the limiter first and backing off on throttling. refresh
+# is called with the body before every retry and can replace it with a newer one, or
+# return None when nothing needs sending anymore. returns whether a body was sent
+def sendWithRetry(
+    send,
+    body,
+    limiter=None,
+    retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 32.0,
+    refresh=None,
+    sleep=time.sleep,
+    rng=random.random,
+):
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            send(body)
+            return True
+        except Exception as err:
+            if attempt >= retries or not isRetryable(err):
+                raise
+            sleep(backoffDelay(attempt, base_delay, max_delay, rng))
+            attempt += 1
+            if refresh is not None:
+                body = refresh(body)
+                if body is None:
+                    return False
+
+
+# user credentials from token_file, refreshed or obtained through the browser flow with
+# secrets_file when missing or expired, and saved back to token_file. the google libraries
+# are imported here so runs that never touch a sheet don't need them installed
+def loadCredentials(
+    scopes,
+    token_file: str = "token.json",
+    secrets_file: str = "credentials.json",
+):
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    creds = None
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, scopes)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(secrets_file, scopes)
+            creds = flow.run_local_server(port=0)
+        with open(token_file, "w") as token:
+            token.write(creds.to_json())
+    return creds
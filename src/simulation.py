@@ -1,14 +1,20 @@
-import math
+import utilityclasses.BufferedStepper as BufferedStepper
 import utilityclasses.GridObject as GridObject
 import utilityclasses.SimArray as SimArray
+import utilityclasses.DeltaEncoder as DeltaEncoder
+import utilityclasses.SheetPublisher as SheetPublisher
+import utilityclasses.Trajectory as Trajectory
+import utilityclasses.RunMetrics as RunMetrics
+import utilityclasses.SpillTrace as SpillTrace
+import utilityclasses.SteadyState as SteadyState
 import testgrids as tg
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google.oauth2 import service_account
+import engines
+import encoders
+import lod
+import sheetsclient
 import numpy as np
+import atexit
+import contextlib
 import time
 
 
@@ -17,13 +23,41 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
+# reductions of a state's (density, ux, uy), over the last two axes so they also work on
+# stacks of grids
+REDUCTIONS = {
+    "mass": lambda d, ux, uy: d.sum(axis=(-2, -1)),
+    "max_density": lambda d, ux, uy: d.max(axis=(-2, -1)),
+    "max_speed": lambda d, ux, uy: np.sqrt(ux**2 + uy**2).max(axis=(-2, -1)),
+    "wet_cells": lambda d, ux, uy: (d > 0).sum(axis=(-2, -1)),
+}
 
-def genTestGrid(testNum: int = 1):
-    return (
-        SimArray.SimArray(tg.getTestGrid(testNum))
-        if tg.getTestGrid(testNum)
-        else SimArray.SimArray([[0 for x in range(40)] for y in range(40)])
-    )
+# worker pools for parallel stepping, kept per grid shape so they are only started once
+_strip_steppers = {}
+
+
+# land is a boolean mask of the grid's shape, after scaling, its cells are emptied
+def genTestGrid(testNum: int = 1, shape: tuple = None, dtype=np.float64, land=None):
+    grid = tg.getTestGrid(testNum)
+    if not grid:
+        return SimArray.SimArray(np.zeros(shape or (40, 40)), land=land, dtype=dtype)
+    if shape is not None:
+        grid = tg.scaleGrid(grid, *shape)
+    return SimArray.SimArray(grid, land=land, dtype=dtype)
+
+
+# 1 -> A, 26 -> Z, 27 -> AA, 40 -> AN
+def columnLetters(column: int):
+    letters = ""
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+# A1 notation covering a rows x cols grid starting at the top left cell of the sheet
+def gridRange(rows: int, cols: int, sheet: str = "Grid"):
+    return f"{sheet}!A1:{columnLetters(cols)}{rows}"
 
 
 # v is for velocity numbers displayed and d is for density numbers displayed
@@ -131,122 +165,191 @@ def updateSheetFromBody(
     return response
 
 
-def runSim(init_sim: SimArray, verbose=False):
-    sim = init_sim.copy()
-    total_density_before = np.sum([[cell.Density for cell in row] for row in sim])
+# multiprocessing is only imported once a run asks for workers
+def getStripStepper(shape, workers: int, engine: str, dtype=np.float64):
+    key = (tuple(shape), workers, engine, np.dtype(dtype))
+    if key not in _strip_steppers:
+        import utilityclasses.StripStepper as StripStepper
 
-    # create a copy of the densities and velocities to update
-    new_densities = np.array(
-        [[cell.Density for cell in row] for row in sim], dtype=float
-    )
-    new_ux = np.array([[cell.ux for cell in row] for row in sim], dtype=float)
-    new_uy = np.array([[cell.uy for cell in row] for row in sim], dtype=float)
-
-    # distribute fluid
-    for x in range(40):
-        for y in range(40):
-            cur_density = sim[x][y].Density
-            cur_ux = sim[x][y].ux
-            cur_uy = sim[x][y].uy
-            max_spill = cur_density * 0.75
-            if max_spill > 0:
-                # calculate the amount to distribute to each neighbor
-                neighbors = []
-                if x > 0:
-                    neighbors.append((x - 1, y))
-                if x < 39:
-                    neighbors.append((x + 1, y))
-                if y > 0:
-                    neighbors.append((x, y - 1))
-                if y < 39:
-                    neighbors.append((x, y + 1))
-
-                total_difference = sum(
-                    max(cur_density - sim[nx][ny].Density, 0) for nx, ny in neighbors
-                )
-                if total_difference > 0:
-                    for nx, ny in neighbors:
-                        difference = max(cur_density - sim[nx][ny].Density, 0)
-                        direction_factor = 1.0
-                        if nx == x + 1:
-                            direction_factor += cur_ux
-                        elif nx == x - 1:
-                            direction_factor -= cur_ux
-                        if ny == y + 1:
-                            direction_factor += cur_uy
-                        elif ny == y - 1:
-                            direction_factor -= cur_uy
-                        direction_factor = max(
-                            direction_factor, 0
-                        )  # ensure non-negative
-
-                        spill_amount = (
-                            max_spill
-                            * (difference / total_difference)
-                            * 0.25
-                            * direction_factor
-                        )
-                        if verbose:
-                            print(
-                                f"Spilling {spill_amount} from ({x}, {y}) to ({nx}, {ny})"
-                            )
-                        if verbose:
-                            print(
-                                f"Before: {new_densities[x][y]}, {new_densities[nx][ny]}"
-                            )
-                        new_densities[nx][ny] += spill_amount
-                        new_densities[x][y] -= spill_amount
-                        if verbose:
-                            print(
-                                f"After: {new_densities[x][y]}, {new_densities[nx][ny]}"
-                            )
-
-                        # transfer velocities along with the fluid
-                        new_ux[nx][ny] = (
-                            new_ux[nx][ny] * sim[nx][ny].Density + cur_ux * spill_amount
-                        ) / new_densities[nx][ny]
-                        new_uy[nx][ny] = (
-                            new_uy[nx][ny] * sim[nx][ny].Density + cur_uy * spill_amount
-                        ) / new_densities[nx][ny]
-
-                        # introduce velocity based on density difference (potential energy to kinetic energy conversion)
-                        velocity_introduction = math.sqrt(
-                            difference
-                        )  # simplified conversion
-                        if nx == x + 1:
-                            new_ux[nx][ny] += velocity_introduction
-                        elif nx == x - 1:
-                            new_ux[nx][ny] -= velocity_introduction
-                        if ny == y + 1:
-                            new_uy[nx][ny] += velocity_introduction
-                        elif ny == y - 1:
-                            new_uy[nx][ny] -= velocity_introduction
-
-                        # handle cells next to walls by redirecting velocity
-                        if nx == 0 and new_ux[nx][ny] < 0:
-                            new_ux[nx][ny] = -new_ux[nx][ny]
-                        elif nx == 39 and new_ux[nx][ny] > 0:
-                            new_ux[nx][ny] = -new_ux[nx][ny]
-                        if ny == 0 and new_uy[nx][ny] < 0:
-                            new_uy[nx][ny] = -new_uy[nx][ny]
-                        elif ny == 39 and new_uy[nx][ny] > 0:
-                            new_uy[nx][ny] = -new_uy[nx][ny]
-
-    # update the densities and velocities in the simulation
-    for x in range(40):
-        for y in range(40):
-            sim[x][y].Density = new_densities[x][y]
-            sim[x][y].ux = new_ux[x][y]
-            sim[x][y].uy = new_uy[x][y]
-
-    total_density_after = np.sum([[cell.Density for cell in row] for row in sim])
-    assert np.isclose(
-        total_density_before, total_density_after
-    ), "Density is not conserved!"
+        _strip_steppers[key] = StripStepper.StripStepper(shape, workers, engine, dtype)
+    return _strip_steppers[key]
+
+
+@atexit.register
+def closeStripSteppers():
+    while _strip_steppers:
+        _strip_steppers.popitem()[1].close()
+
+
+# check sums the density before and after the step to assert it was conserved, see
+# BufferedStepper for cheaper checks. like verbose, trace only applies to the loop engine,
+# and step is the simulation step its events are recorded under.
+# dt is the simulated time the step covers. a spill step moves at most one step's worth of
+# fluid, so the spill engines take dt <= 1 and move dt of it, keeping the velocities the
+# full step set up as the rates it ran at. dt 1 is the plain step
+def runSim(
+    init_sim: SimArray,
+    verbose=False,
+    engine: str = "loop",
+    workers: int = 1,
+    check: bool = True,
+    trace: SpillTrace.SpillTrace = None,
+    dt: float = 1.0,
+    step: int = None,
+):
+    if check:
+        total_density_before = engines.totalMass(init_sim.density)
+
+    # every step starts the fluid from rest, like copying the grid always did. the sqrt
+    # velocity kick is added on every step, so carrying it over makes the spill diverge.
+    # the stable engine's velocities are its state and carry over
+    dtype = engines.floatType(init_sim.density)
+    engine_step = engines.ENGINES[engine]
+    land = init_sim.land
+    if engine in engines.CARRIES_VELOCITY:
+        if workers > 1:
+            raise ValueError(f"the {engine} engine solves the whole grid at once")
+        new_densities, new_ux, new_uy = engine_step(
+            init_sim.density, init_sim.ux, init_sim.uy, land=land, dt=dt
+        )
+    elif dt > 1:
+        raise ValueError(f"the {engine} engine steps at most dt 1, not {dt}")
+    elif workers > 1:
+        rest = np.zeros(init_sim.shape, dtype)
+        stepper = getStripStepper(init_sim.shape, workers, engine, dtype)
+        new_densities, new_ux, new_uy = stepper.step(init_sim.density, rest, rest, land)
+    elif engine == "loop":
+        rest = np.zeros(init_sim.shape, dtype)
+        new_densities, new_ux, new_uy = engine_step(
+            init_sim.density, rest, rest, verbose, land=land, trace=trace, step=step
+        )
+    else:
+        rest = np.zeros(init_sim.shape, dtype)
+        new_densities, new_ux, new_uy = engine_step(
+            init_sim.density, rest, rest, land=land
+        )
+    if dt != 1 and engine not in engines.CARRIES_VELOCITY:
+        new_densities -= init_sim.density
+        new_densities *= dt
+        new_densities += init_sim.density
+    sim = SimArray.SimArray.fromArrays(new_densities, new_ux, new_uy, init_sim.land)
+
+    if check:
+        total_density_after = engines.totalMass(sim.density)
+        assert engines.massConserved(
+            total_density_before, total_density_after, dtype
+        ), "Density is not conserved!"
 
     return sim
 
 
+# courant number the adaptive timestep keeps to: the fastest cell moves at most this many
+# cells per step. the spill rule moves a step's worth of fluid at most, the stable engine
+# stays stable at any dt and is only held back for accuracy
+CFL = 1.0
+MAX_DT = {"stable": 10.0}
+MIN_DT = 1e-3
+
+
+# the largest timestep that keeps the fastest velocity component within cfl cells a step,
+# capped at max_dt and the engine's own cap and kept above MIN_DT so a spike can't stall
+# the run. only engines that carry their velocity are limited by it, the spill engines'
+# velocities are the last step's kick from rest and say nothing about how fast fluid moves,
+# so they always take their largest step
+def cflTimestep(sim, engine: str = "numpy", cfl: float = CFL, max_dt: float = None):
+    limit = MAX_DT.get(engine, 1.0)
+    max_dt = limit if max_dt is None else min(max_dt, limit)
+    if engine not in engines.CARRIES_VELOCITY:
+        return max_dt
+    speed = max(np.abs(sim.ux).max(initial=0), np.abs(sim.uy).max(initial=0))
+    if not speed > 0:
+        return max_dt
+    return float(min(max_dt, max(cfl / speed, MIN_DT)))
+
+
+# (state, sub-steps) after `duration` of simulated time, in steps sized by cflTimestep from
+# the state before each of them. the last step is cut short to land on duration exactly
+def advance(
+    sim,
+    duration: float,
+    engine: str = "numpy",
+    workers: int = 1,
+    cfl: float = CFL,
+    max_dt: float = None,
+    trace: SpillTrace.SpillTrace = None,
+    step: int = None,
+):
+    elapsed = 0.0
+    substeps = 0
+    while duration - elapsed > 1e-9 * duration:
+        dt = min(cflTimestep(sim, engine, cfl, max_dt), duration - elapsed)
+        sim = runSim(sim, engine=engine, workers=workers, trace=trace, dt=dt, step=step)
+        elapsed += dt
+        substeps += 1
+    return sim, substeps
+
+
+# yields (step, state) every `every` steps, forever when steps is None. each state is the
+# one runSim produced behind read only views, so nothing is copied and consumers can hold
+# on to frames safely. stop early by breaking out of the loop or with until(step, state).
+# with frame_time a step is frame_time of simulated time advanced in adaptive sub-steps,
+# so frames come at fixed simulated times however fast the fluid moves.
+# with buffered, plain steps of the numpy, numba and active engines run in a
+# BufferedStepper and allocate nothing, but their frames live in its two buffers: a frame
+# is only valid until the next one is taken, and with every 1 alongside the next one. it
+# is for consumers that copy or finish with a frame right away, other runs ignore it
+def iterate(
+    init_sim: SimArray,
+    steps: int = None,
+    every: int = 1,
+    engine: str = "numpy",
+    workers: int = 1,
+    verbose=False,
+    start: int = 0,
+    until=None,
+    trace: SpillTrace.SpillTrace = None,
+    frame_time: float = None,
+    cfl: float = CFL,
+    max_dt: float = None,
+    buffered: bool = False,
+):
+    sim = init_sim
+    step = start
+    stepper = None
+    if (
+        buffered
+        and frame_time is None
+        and workers == 1
+        and trace is None
+        and not verbose
+        and engine in BufferedStepper.ENGINES
+    ):
+        stepper = BufferedStepper.BufferedStepper(init_sim, engine)
+    while steps is None or step < start + steps:
+        step += 1
+        if stepper is not None:
+            sim = stepper.step()
+        elif frame_time is None:
+            sim = runSim(sim, verbose, engine, workers, trace=trace, step=step)
+        else:
+            sim, _ = advance(sim, frame_time, engine, workers, cfl, max_dt, trace, step)
+        if step % every:
+            continue
+        frame = sim.readOnly()
+        yield step, frame
+        if until is not None and until(step, frame):
+            return
+
+
+# (step, {name: value}) for every frame, for analysis that doesn't need the states
+def reduceFrames(frames, reductions=("mass", "max_speed")):
+    for step, sim in frames:
+        yield step, {
+            name: REDUCTIONS[name](sim.density, sim.ux, sim.uy).item()
+            for name in reductions
+        }
+
+
 # TEST_GRID_ID = 7
 # DATA_DISPLAY_TYPE = "v"
 # COLOR_INTERPOLATION = "l"
@@ -256,14 +359,73 @@ def runSim(init_sim: SimArray, verbose=False):
 def main(
     creds,
     SPREADSHEET_ID,
-    GRID_RANGE: str = "Grid!A1:AN40",
+    GRID_RANGE: str = None,
     TEST_GRID_ID: int = 7,
     DATA_DISPLAY_TYPE: str = "v",
     COLOR_INTERPOLATION: str = "l",
-    VERBOSE_VAL: bool = True,
+    VERBOSE_VAL: bool = False,
+    ENGINE: str = "loop",
+    GRID_SHAPE: tuple = None,
+    WORKERS: int = 1,
+    BODY_ENCODING: str = "cells",
+    ASYNC_PUBLISH: bool = False,
+    STEP_INTERVAL: float = 1,
+    MAX_RETRIES: int = 5,
+    WRITES_PER_MINUTE: int = sheetsclient.WRITE_REQUESTS_PER_MINUTE,
+    SERVICE=None,
+    CHECKPOINT_FILE: str = None,
+    PROFILE: bool = False,
+    METRICS_FILE: str = None,
+    METRICS_PORT: int = None,
+    TRACE_FILE: str = None,
+    STEPS: int = None,
+    DISPLAY_SHAPE: tuple = None,
+    DISPLAY_WINDOW: tuple = None,
+    PRECISION: str = "float64",
+    FRAME_TIME: float = None,
+    CFL_NUMBER: float = CFL,
+    MAX_TIMESTEP: float = None,
+    STEADY_TOLERANCE: float = None,
+    STEADY_STOP: bool = False,
+    LAND=None,
 ):
+    # PRECISION "float32" halves the memory of the state and the bandwidth of every step
+    dtype = engines.PRECISIONS[PRECISION]
+    # LAND is a boolean mask of the test grid's shape, its cells are solid walls
+    test_grid = genTestGrid(TEST_GRID_ID, GRID_SHAPE, dtype, LAND)
+    step = 0
+    # every step is appended to CHECKPOINT_FILE, and a run with an existing file picks up
+    # from its last frame instead of the test grid
+    trajectory = None
+    if CHECKPOINT_FILE is not None:
+        trajectory = Trajectory.Trajectory(CHECKPOINT_FILE, test_grid.shape, dtype)
+        if len(trajectory):
+            step, test_grid = trajectory.resume()
+            test_grid = test_grid.astype(dtype)
+            print(f"Resuming from step {step} of {CHECKPOINT_FILE}")
+        else:
+            trajectory.append(test_grid, step)
+    # grids larger than DISPLAY_SHAPE are published as block averaged tiles, and
+    # DISPLAY_WINDOW (row slice, col slice) zooms into part of the grid, see lod.downsample.
+    # a window is shown at lod.DISPLAY_SHAPE unless a display shape is given
+    if DISPLAY_WINDOW is not None and DISPLAY_SHAPE is None:
+        DISPLAY_SHAPE = lod.DISPLAY_SHAPE
+    view = lambda sim: sim
+    if DISPLAY_SHAPE is not None or DISPLAY_WINDOW is not None:
+        view = lambda sim: lod.downsample(
+            sim, DISPLAY_SHAPE or sim.shape, DISPLAY_WINDOW
+        )
+    if GRID_RANGE is None:
+        GRID_RANGE = gridRange(*view(test_grid).shape)
+
     print(f"Using range: {GRID_RANGE} on spreadsheet {SPREADSHEET_ID}")
-    service = build("sheets", "v4", credentials=creds)
+    # SERVICE lets a FakeSheetsService stand in for the real API. the google client is only
+    # imported here, so runs that never touch a sheet don't need it installed
+    service = SERVICE
+    if service is None:
+        from googleapiclient.discovery import build
+
+        service = build("sheets", "v4", credentials=creds)
     sheet = service.spreadsheets()
     result = (
         sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=GRID_RANGE).execute()
@@ -273,12 +435,130 @@ def main(
         print("No data found.")
         return
 
-    test_grid = genTestGrid(TEST_GRID_ID)
+    # "cells" sends a request per cell, "grid" one request for the whole grid and "delta"
+    # only the cells that look different from the last frame. a frame that would show
+    # exactly what the sheet already shows encodes to no requests with every encoding
+    delta_encoder = DeltaEncoder.DeltaEncoder(COLOR_INTERPOLATION, DATA_DISPLAY_TYPE)
+    shown = {"pending": None, "sent": None}
 
-    while True:
-        time.sleep(1)
-        test_grid = runSim(test_grid, VERBOSE_VAL)
-        body, test_grid = genBodyFromSim(
-            test_grid, COLOR_INTERPOLATION, DATA_DISPLAY_TYPE
+    def encode(sim):
+        sim = view(sim)
+        signature = encoders.displaySignature(
+            sim, COLOR_INTERPOLATION, DATA_DISPLAY_TYPE
         )
+        if shown["sent"] is not None and encoders.sameSignature(
+            signature, shown["sent"]
+        ):
+            return {"requests": []}
+        shown["pending"] = signature
+        match BODY_ENCODING:
+            case "grid":
+                return encoders.genGridBody(
+                    sim, COLOR_INTERPOLATION, DATA_DISPLAY_TYPE
+                )[0]
+            case "delta":
+                return delta_encoder.encode(sim)
+        return genBodyFromSim(sim, COLOR_INTERPOLATION, DATA_DISPLAY_TYPE)[0]
+
+    def send(body):
+        if metrics is not None:
+            metrics.requestBytes(body)
         updateSheetFromBody(service, SPREADSHEET_ID, body)
+        delta_encoder.markSent()
+        shown["sent"] = shown["pending"]
+
+    # PROFILE times every phase of a frame and prints a rolling summary. METRICS_FILE also
+    # writes every frame to a .csv or .jsonl file, METRICS_PORT serves prometheus text
+    metrics = None
+    phase = lambda name: contextlib.nullcontext()
+    if PROFILE or METRICS_FILE is not None or METRICS_PORT is not None:
+        metrics = RunMetrics.RunMetrics(path=METRICS_FILE)
+        phase = metrics.phase
+        if METRICS_PORT is not None:
+            print(f"Serving metrics on port {metrics.serve(METRICS_PORT)}")
+
+    # writes are paced to the sheets quota and throttled writes are retried with backoff
+    limiter = sheetsclient.sheetsLimiter(WRITES_PER_MINUTE)
+
+    # with ASYNC_PUBLISH the sheet is updated from a background thread that always sends
+    # the newest frame, so the simulation runs at STEP_INTERVAL instead of http speed
+    # the publisher thread encodes and sends, so those phases are timed over there
+    publisher = None
+    if ASYNC_PUBLISH:
+        publisher = SheetPublisher.SheetPublisher(
+            encode if metrics is None else metrics.timed("encode", encode),
+            send if metrics is None else metrics.timed("publish", send),
+            limiter=limiter,
+            retries=MAX_RETRIES,
+        ).start()
+
+    # VERBOSE_VAL prints every spill of the loop engine, TRACE_FILE records them in a trace
+    # buffer instead and writes it when the run stops. the run goes on until interrupted
+    # unless STEPS is given. with FRAME_TIME every frame is that much simulated time,
+    # sub-stepped to keep CFL_NUMBER with steps of at most MAX_TIMESTEP
+    trace = SpillTrace.SpillTrace() if TRACE_FILE is not None else None
+    # with STEADY_TOLERANCE the run watches the largest change between steps, and once the
+    # fluid has settled it either stops (STEADY_STOP) or backs off to ever longer intervals
+    steady = None
+    if STEADY_TOLERANCE is not None:
+        steady = SteadyState.SteadyState(STEADY_TOLERANCE)
+    interval = STEP_INTERVAL
+    frames = iterate(
+        test_grid,
+        STEPS,
+        1,
+        ENGINE,
+        WORKERS,
+        VERBOSE_VAL,
+        start=step,
+        trace=trace,
+        frame_time=FRAME_TIME,
+        cfl=CFL_NUMBER,
+        max_dt=MAX_TIMESTEP,
+        # every frame is encoded, saved and checked before the next step, only the
+        # publisher thread holds on to frames while the simulation goes on
+        buffered=not ASYNC_PUBLISH,
+    )
+    # a run that ends by itself still sends its last frame, an interrupted one doesn't wait
+    finished = False
+    try:
+        while True:
+            with phase("sleep"):
+                time.sleep(interval)
+            with phase("step"):
+                frame = next(frames, None)
+            if frame is None:
+                break
+            step, test_grid = frame
+            if trajectory is not None:
+                trajectory.append(test_grid, step)
+            if publisher is not None:
+                publisher.submit(test_grid)
+            else:
+                with phase("encode"):
+                    body = encode(test_grid)
+                if body["requests"]:
+                    with phase("publish"):
+                        sheetsclient.sendWithRetry(send, body, limiter, MAX_RETRIES)
+            if metrics is not None:
+                metrics.endFrame(step, test_grid)
+            if steady is not None:
+                steady.update(test_grid)
+                if steady.steady and STEADY_STOP:
+                    print(f"Steady at step {step} (residual {steady.residual:.2e})")
+                    break
+                interval = steady.interval(STEP_INTERVAL)
+        finished = True
+    finally:
+        if publisher is not None:
+            publisher.close(flush=finished)
+        if trajectory is not None:
+            trajectory.close()
+        if metrics is not None:
+            metrics.close()
+        if trace is not None:
+            trace.dump(TRACE_FILE)
+            print(f"Wrote {len(trace)} of {trace.count} spill events to {TRACE_FILE}")
+    # the publisher thread stops at its first error, which would otherwise go unseen
+    if publisher is not None and publisher.error is not None:
+        raise publisher.error
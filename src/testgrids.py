@@ -1,6 +1,7 @@
 import os.path
 import sys
 import math
+import numpy as np
 import utilityclasses.GridObject as GridObject
 import utilityclasses.SimArray as SimArray
 def getTestGrid(testNum):
@@ -242,4 +243,12 @@ def getTestGrid(testNum):
                 [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
                 [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
                 [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]
-        return mygrid
\ No newline at end of file
+        return mygrid
+
+
+# nearest neighbour rescale of a test grid so the same shapes can seed larger domains
+def scaleGrid(grid, rows, cols):
+    grid = np.asarray(grid, dtype=float)
+    row_index = np.arange(rows) * grid.shape[0] // rows
+    col_index = np.arange(cols) * grid.shape[1] // cols
+    return grid[np.ix_(row_index, col_index)]
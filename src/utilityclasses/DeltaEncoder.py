@@ -0,0 +1,81 @@
+import numpy as np
+
+import encoders
+
+
+class DeltaEncoder:
+    # remembers the last frame sent to the sheet and only encodes the cells whose shown
+    # value or colour bucket changed since then, merged into runs along each row. a frame
+    # only counts as sent once markSent is called, so a body that failed to go out is
+    # folded into the next one instead of being lost
+    def __init__(
+        self,
+        interpolation: str = "l",
+        data: str = "d",
+        color_buckets: int = 256,
+        sheet_id: int = 0,
+    ):
+        self.interpolation = interpolation
+        self.data = data
+        self.color_buckets = color_buckets
+        self.sheet_id = sheet_id
+        self.last_values = None
+        self.last_buckets = None
+        self.pending = None
+
+    def reset(self):
+        # forget the last frame, e.g. after a failed push, so the next body is complete
+        self.last_values = None
+        self.last_buckets = None
+        self.pending = None
+
+    def markSent(self):
+        if self.pending is not None:
+            self.last_values, self.last_buckets = self.pending
+            self.pending = None
+
+    def buckets(self, channels):
+        return encoders.colorBuckets(channels, self.color_buckets)
+
+    def changedCells(self, values, buckets):
+        if self.last_values is None or self.last_values.shape != values.shape:
+            return np.ones(values.shape, dtype=bool)
+        changed = values != self.last_values
+        if buckets is not None:
+            changed |= (buckets != self.last_buckets).any(axis=0)
+        return changed
+
+    def encode(self, sim):
+        values = encoders.displayValues(sim, self.data)
+        channels = encoders.colorChannels(
+            encoders.displayDensity(sim), self.interpolation
+        )
+        buckets = self.buckets(channels)
+        changed = self.changedCells(values, buckets)
+
+        font_size = encoders.fontSize(self.data)
+        value_key = encoders.valueKey(self.data)
+        fields = encoders.cellFields(self.data)
+        requests = []
+        for row in np.flatnonzero(changed.any(axis=1)):
+            # start and end columns of each run of changed cells in this row
+            edges = np.flatnonzero(
+                np.diff(changed[row].astype(np.int8), prepend=0, append=0)
+            )
+            for start, stop in zip(edges[::2], edges[1::2]):
+                cells = encoders.cellBlock(
+                    values,
+                    channels,
+                    slice(row, row + 1),
+                    slice(start, stop),
+                    font_size,
+                    value_key,
+                )
+                requests.append(
+                    encoders.updateCellsRequest(
+                        int(row), int(start), cells, fields, self.sheet_id
+                    )
+                )
+
+        self.pending = (values, buckets)
+        return {"requests": requests}
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class FakeHttpError(Exception):
+    # stands in for googleapiclient's HttpError when the google client isn't installed
+    def __init__(self, resp, content: bytes):
+        super().__init__(f"<HttpError {resp.status} {content.decode()}>")
+        self.resp = resp
+        self.content = content
+
+
+class FakeResponse:
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+def httpError(status: int, reason: str):
+    resp = FakeResponse(status, reason)
+    try:
+        from googleapiclient.errors import HttpError
+    except ImportError:
+        return FakeHttpError(resp, reason.encode())
+    return HttpError(resp, reason.encode())
+
+
+class _Request:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+
+class FakeSheetsService:
+    # a local stand-in for build("sheets", "v4", ...) that applies updateCells and
+    # repeatCell requests to an in-memory sheet and enforces a write quota, so the
+    # publishing code can be exercised without credentials or network access
+    def __init__(
+        self,
+        rows: int = 40,
+        cols: int = 40,
+        quota: int = 60,
+        window: float = 60.0,
+        latency: float = 0.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.rows = rows
+        self.cols = cols
+        self.quota = quota
+        self.window = window
+        self.latency = latency
+        self.clock = clock
+        self.sleep = sleep
+        self.cells = {}
+        self.calls = deque()
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.throttled = 0
+        self.bytes_received = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    # the keyword is called range in the real api, so the builtin is shadowed in here
+    def get(self, spreadsheetId, range):
+        values = [[""] * self.cols] * self.rows
+        return _Request(lambda: {"values": values})
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _Request(lambda: self.apply(body))
+
+    def apply(self, body):
+        if self.latency:
+            self.sleep(self.latency)
+        with self.lock:
+            now = self.clock()
+            while self.calls and now - self.calls[0] >= self.window:
+                self.calls.popleft()
+            if len(self.calls) >= self.quota:
+                self.throttled += 1
+                raise httpError(429, "Quota exceeded for quota metric 'Write requests'")
+            if not body.get("requests"):
+                raise httpError(400, "Must specify at least one request.")
+            self.calls.append(now)
+            self.accepted += 1
+            self.bytes_received += len(json.dumps(body))
+            for request in body["requests"]:
+                if "updateCells" in request:
+                    self.updateCells(request["updateCells"])
+                elif "repeatCell" in request:
+                    self.repeatCell(request["repeatCell"])
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def updateCells(self, update):
+        top = update["range"]["startRowIndex"]
+        left = update["range"]["startColumnIndex"]
+        for i, row in enumerate(update["rows"]):
+            for j, value in enumerate(row["values"]):
+                self.merge((top + i, left + j), value)
+
+    def repeatCell(self, repeat):
+        grid_range = repeat["range"]
+        for i in range(grid_range["startRowIndex"], grid_range["endRowIndex"]):
+            for j in range(
+                grid_range["startColumnIndex"], grid_range["endColumnIndex"]
+            ):
+                self.merge((i, j), repeat["cell"])
+
+    def merge(self, key, value):
+        cell = self.cells.setdefault(key, {})
+        for field, content in value.items():
+            if isinstance(content, dict):
+                cell.setdefault(field, {}).update(content)
+            else:
+                cell[field] = content
@@ -0,0 +1,118 @@
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+
+import numpy as np
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".mov", ".avi", ".gif")
+
+
+# a png file for an rgb image, written with zlib directly so no imaging library is needed.
+# level 1 compresses the flat colour blocks well and is much faster than the default
+def pngBytes(image, level: int = 1):
+    rows, cols, _ = image.shape
+    scanlines = np.zeros((rows, 1 + cols * 3), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(rows, cols * 3)
+
+    def chunk(kind: bytes, payload: bytes):
+        return (
+            struct.pack(">I", len(payload))
+            + kind
+            + payload
+            + struct.pack(">I", zlib.crc32(kind + payload))
+        )
+
+    header = struct.pack(">IIBBBBB", cols, rows, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), level))
+        + chunk(b"IEND", b"")
+    )
+
+
+def writePng(path: str, image, level: int = 1):
+    with open(path, "wb") as file:
+        file.write(pngBytes(image, level))
+
+
+class FrameWriter:
+    # writes rgb frames to a numbered png sequence, or pipes them to ffmpeg when output is
+    # a video file name. a png output is either a directory or a pattern like
+    # "frames/step_{:05d}.png"
+    def __init__(self, output: str, fps: int = 30, level: int = 1, ffmpeg="ffmpeg"):
+        self.output = output
+        self.fps = fps
+        self.level = level
+        self.ffmpeg = ffmpeg
+        self.frames = 0
+        self.process = None
+        self.video = output.lower().endswith(VIDEO_EXTENSIONS)
+        if not self.video:
+            if "{" not in output:
+                output = os.path.join(output, "frame_{:05d}.png")
+            self.pattern = output
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+    def write(self, image):
+        if self.video:
+            if self.process is None:
+                self.open(image.shape)
+            elif image.shape != self.shape:
+                raise ValueError(f"Frame shape {image.shape} is not {self.shape}")
+            self.process.stdin.write(np.ascontiguousarray(image).tobytes())
+        else:
+            writePng(self.pattern.format(self.frames), image, self.level)
+        self.frames += 1
+
+    def open(self, shape):
+        # ffmpeg is started on the first frame, once the frame size is known
+        executable = shutil.which(self.ffmpeg)
+        if executable is None:
+            raise FileNotFoundError(
+                f"{self.ffmpeg} was not found, write a png sequence instead"
+            )
+        self.shape = shape
+        rows, cols, _ = shape
+        self.process = subprocess.Popen(
+            [
+                executable,
+                "-loglevel",
+                "error",
+                "-y",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{cols}x{rows}",
+                "-r",
+                str(self.fps),
+                "-i",
+                "-",
+                # yuv420p needs even dimensions
+                "-vf",
+                "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt",
+                "yuv420p",
+                self.output,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(
+                    f"ffmpeg exited with status {self.process.returncode}"
+                )
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
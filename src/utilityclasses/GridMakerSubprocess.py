@@ -1,17 +1,23 @@
 import tkinter as tk
 from tkinter import messagebox
 
+import utilityclasses.SimArray as SimArray
+
 class GridMakerSubprocess:
     def __init__(self, n, m):
         self.n = n
         self.m = m
         self.grid = [[0 for _ in range(m)] for _ in range(n)]
+        # cells marked as land hold no fluid and reflect it like the edges of the grid
+        self.land = [[0 for _ in range(m)] for _ in range(n)]
         self.window = tk.Tk()
         self.window.title("Grid Maker Subprocess")
         self.buttons = [[None for _ in range(m)] for _ in range(n)]
         self.white_image = tk.PhotoImage(width=10, height=10)
         self.black_image = tk.PhotoImage(width=10, height=10)
         self.black_image.put(("black",), to=(0, 0, 10, 10))
+        self.land_image = tk.PhotoImage(width=10, height=10)
+        self.land_image.put(("saddle brown",), to=(0, 0, 10, 10))
         self.first_click = None
         self.create_grid()
         self.create_submit_button()
@@ -23,23 +29,21 @@ class GridMakerSubprocess:
                 button = tk.Button(self.window, image=self.white_image, padx=0, pady=0)
                 button.grid(row=i, column=j, padx=1, pady=1)
                 button.bind("<Button-1>", lambda event, i=i, j=j: self.on_button_click(event, i, j))
+                # right click paints land instead of fluid
+                button.bind("<Button-3>", lambda event, i=i, j=j: self.on_button_click(event, i, j, land=True))
                 self.buttons[i][j] = button
 
-    def toggle_button(self, i, j, toggle_range=False):
-        if toggle_range:
-            if self.grid[i][j] == 0:
-                self.grid[i][j] = 1
-                self.buttons[i][j].config(image=self.black_image)
-            else:
-                self.grid[i][j] = 0
-                self.buttons[i][j].config(image=self.white_image)
+    def toggle_button(self, i, j, land=False):
+        cells = self.land if land else self.grid
+        if cells[i][j] == 0:
+            # a cell is either fluid or land
+            self.grid[i][j] = 0
+            self.land[i][j] = 0
+            cells[i][j] = 1
+            self.buttons[i][j].config(image=self.land_image if land else self.black_image)
         else:
-            if self.grid[i][j] == 0:
-                self.grid[i][j] = 1
-                self.buttons[i][j].config(image=self.black_image)
-            else:
-                self.grid[i][j] = 0
-                self.buttons[i][j].config(image=self.white_image)
+            cells[i][j] = 0
+            self.buttons[i][j].config(image=self.white_image)
 
     def create_submit_button(self):
         submit_button = tk.Button(self.window, text="Submit", command=self.submit)
@@ -49,25 +53,35 @@ class GridMakerSubprocess:
         formatted_grid = "[" + ",\n ".join(str(row) for row in self.grid) + "]"
         print("Generated Grid:")
         print(formatted_grid)
-        messagebox.showinfo("Grid", f"Generated Grid:\n{formatted_grid}")
+        message = f"Generated Grid:\n{formatted_grid}"
+        if any(any(row) for row in self.land):
+            formatted_land = "[" + ",\n ".join(str(row) for row in self.land) + "]"
+            print("Land Mask:")
+            print(formatted_land)
+            message += f"\nLand Mask:\n{formatted_land}"
+        messagebox.showinfo("Grid", message)
         self.window.destroy()
 
-    def on_button_click(self, event, i, j):
+    def to_sim_array(self):
+        # the drawn grid as a simulation state, with full cells and the land mask
+        return SimArray.SimArray(self.grid, land=self.land)
+
+    def on_button_click(self, event, i, j, land=False):
         if event.state & 0x0001:  # Check if Shift key is pressed
             if self.first_click is None:
                 self.first_click = (i, j)
             else:
-                self.toggle_range(self.first_click, (i, j))
+                self.toggle_range(self.first_click, (i, j), land)
                 self.first_click = None
         else:
-            self.toggle_button(i, j)
+            self.toggle_button(i, j, land=land)
 
-    def toggle_range(self, start, end):
+    def toggle_range(self, start, end, land=False):
         start_i, start_j = start
         end_i, end_j = end
         for i in range(min(start_i, end_i), max(start_i, end_i) + 1):
             for j in range(min(start_j, end_j), max(start_j, end_j) + 1):
-                self.toggle_button(i, j, toggle_range=True)
+                self.toggle_button(i, j, land=land)
 
 # Example usage
 if __name__ == "__main__":
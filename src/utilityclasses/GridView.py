@@ -0,0 +1,67 @@
+class CellView:
+    # stands in for a GridObject by reading and writing one cell of a SimArray's arrays
+    __slots__ = ("sim", "x", "y")
+
+    def __init__(self, sim, x: int, y: int):
+        self.sim = sim
+        self.x = x
+        self.y = y
+
+    @property
+    def Density(self):
+        return float(self.sim.density[self.x, self.y])
+
+    @Density.setter
+    def Density(self, value):
+        self.sim.density[self.x, self.y] = value
+
+    @property
+    def ux(self):
+        return float(self.sim.ux[self.x, self.y])
+
+    @ux.setter
+    def ux(self, value):
+        self.sim.ux[self.x, self.y] = value
+
+    @property
+    def uy(self):
+        return float(self.sim.uy[self.x, self.y])
+
+    @uy.setter
+    def uy(self, value):
+        self.sim.uy[self.x, self.y] = value
+
+    @property
+    def IsLand(self):
+        return bool(self.sim.land[self.x, self.y])
+
+    @IsLand.setter
+    def IsLand(self, value):
+        self.sim.land[self.x, self.y] = value
+
+    @property
+    def index(self):
+        return (self.x, self.y)
+
+    def __str__(self):
+        return str(self.Density) + " "
+
+
+class RowView:
+    # one row of a SimArray, indexable like the old list of GridObjects
+    __slots__ = ("sim", "x")
+
+    def __init__(self, sim, x: int):
+        self.sim = sim
+        self.x = x
+
+    def __len__(self):
+        return self.sim.density.shape[1]
+
+    def __getitem__(self, y):
+        if not -len(self) <= y < len(self):
+            raise IndexError("grid column index out of range")
+        return CellView(self.sim, self.x, y % len(self))
+
+    def __iter__(self):
+        return (CellView(self.sim, self.x, y) for y in range(len(self)))
@@ -0,0 +1,196 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+PHASES = ("step", "encode", "publish", "sleep")
+FIELDS = (
+    ("frame", "step", "time")
+    + tuple(f"{phase}_s" for phase in PHASES)
+    + ("total_s", "mass", "drift", "max_speed", "request_bytes")
+)
+
+
+class RunMetrics:
+    # per frame timings of the run loop phases plus conservation drift, max velocity and
+    # request bytes. frames are kept in a rolling window for summaries, and written to a
+    # csv or jsonl file (by extension) or served as prometheus text when asked to.
+    # phases can be timed from any thread, time spent on the publisher thread is counted
+    # in the frame that is open when it finishes
+    def __init__(
+        self,
+        window: int = 100,
+        path: str = None,
+        report_every: float = 10.0,
+        clock=time.perf_counter,
+    ):
+        self.window = deque(maxlen=window)
+        self.report_every = report_every
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.current = {}
+        self.frames = 0
+        self.initial_mass = None
+        self.reported_at = clock()
+        self.server = None
+        self.file = None
+        self.writer = None
+        if path is not None:
+            self.file = open(path, "w", newline="")
+            if path.endswith(".csv"):
+                self.writer = csv.DictWriter(self.file, FIELDS)
+                self.writer.writeheader()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(f"{name}_s", self.clock() - start)
+
+    def timed(self, name: str, fn):
+        # fn wrapped so every call is timed as the phase `name`
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def add(self, field: str, value):
+        with self.lock:
+            self.current[field] = self.current.get(field, 0) + value
+
+    def requestBytes(self, body):
+        self.add("request_bytes", len(json.dumps(body)))
+
+    def endFrame(self, step: int, sim):
+        mass = float(np.sum(sim.density))
+        if self.initial_mass is None:
+            self.initial_mass = mass
+        with self.lock:
+            record, self.current = self.current, {}
+        record.update(
+            frame=self.frames,
+            step=step,
+            time=time.time(),
+            mass=mass,
+            drift=(
+                abs(mass - self.initial_mass) / self.initial_mass
+                if self.initial_mass
+                else 0.0
+            ),
+            max_speed=float(np.sqrt(sim.ux**2 + sim.uy**2).max(initial=0.0)),
+        )
+        record["total_s"] = sum(record.get(f"{phase}_s", 0.0) for phase in PHASES)
+        self.frames += 1
+        self.window.append(record)
+        self.write(record)
+        if self.report_every and self.clock() - self.reported_at >= self.report_every:
+            self.reported_at = self.clock()
+            self.report()
+        return record
+
+    def write(self, record):
+        if self.file is None:
+            return
+        if self.writer is not None:
+            self.writer.writerow({field: record.get(field, "") for field in FIELDS})
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def summary(self):
+        # mean, median, 95th percentile and max of every field over the rolling window
+        frames = list(self.window)
+        summary = {}
+        for field in FIELDS[3:]:
+            values = np.array([frame.get(field, 0.0) for frame in frames], dtype=float)
+            if values.size:
+                summary[field] = {
+                    "mean": values.mean(),
+                    "p50": np.percentile(values, 50),
+                    "p95": np.percentile(values, 95),
+                    "max": values.max(),
+                }
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        if not summary:
+            return
+        phases = ", ".join(
+            f"{phase} {summary[f'{phase}_s']['mean'] * 1e3:.1f} ms "
+            f"(p95 {summary[f'{phase}_s']['p95'] * 1e3:.1f})"
+            for phase in PHASES
+        )
+        print(
+            f"Frame {self.frames}: {phases}, drift {summary['drift']['max']:.2e}, "
+            f"max speed {summary['max_speed']['max']:.2f}, "
+            f"{summary['request_bytes']['mean'] / 1024:.1f} KiB/frame"
+        )
+
+    def prometheusText(self):
+        summary = self.summary()
+        lines = [
+            "# HELP fluid_frames_total Frames completed by the run loop",
+            "# TYPE fluid_frames_total counter",
+            f"fluid_frames_total {self.frames}",
+        ]
+        if not summary:
+            return "\n".join(lines) + "\n"
+        lines += [
+            "# HELP fluid_phase_seconds Mean seconds per frame in each phase",
+            "# TYPE fluid_phase_seconds gauge",
+        ]
+        lines += [
+            f'fluid_phase_seconds{{phase="{phase}"}} {summary[f"{phase}_s"]["mean"]}'
+            for phase in PHASES
+        ]
+        for name, field, statistic, help_text in (
+            ("fluid_frame_seconds_p95", "total_s", "p95", "95th percentile frame time"),
+            ("fluid_mass_drift", "drift", "max", "Largest relative mass drift"),
+            ("fluid_max_speed", "max_speed", "max", "Largest cell speed"),
+            ("fluid_request_bytes", "request_bytes", "mean", "Mean request bytes"),
+        ):
+            lines += [
+                f"# HELP {name} {help_text} over the window",
+                f"# TYPE {name} gauge",
+                f"{name} {summary[field][statistic]}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1"):
+        # serves prometheusText on every path from a daemon thread
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheusText().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import sheetsclient
+
+_STOP = object()
+
+
+class SheetPublisher:
+    # encodes and sends frames on a background thread so the simulation never waits on
+    # http. only the newest frame is kept: submitting while a frame is still waiting
+    # replaces it. encoding happens on this thread too, so a delta encoder only ever sees
+    # the frames that actually reached the sheet.
+    # with a limiter every send waits for a token, and throttled sends are retried with
+    # backoff. frames that arrive while backing off are merged into the retry by encoding
+    # the newest one in place of the body that was refused, or drop the retry when the
+    # sheet already shows them
+    def __init__(
+        self,
+        encode,
+        send,
+        report_every: float = 10.0,
+        window: int = 20,
+        limiter=None,
+        retries: int = 0,
+    ):
+        self.encode = encode
+        self.send = send
+        self.report_every = report_every
+        self.limiter = limiter
+        self.retries = retries
+        self.pending = queue.Queue(maxsize=1)
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.merged = 0
+        self.error = None
+        self.send_times = deque(maxlen=window)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.reported_at = self.started_at
+        self.thread.start()
+        return self
+
+    def submit(self, sim):
+        # errors from the publisher thread surface here, on the simulation thread
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            try:
+                self.pending.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.pending.put_nowait(sim)
+
+    def run(self):
+        while True:
+            sim = self.pending.get()
+            if sim is _STOP:
+                return
+            try:
+                body = self.encode(sim)
+                if not body["requests"]:
+                    # the sheet already shows this frame
+                    self.skipped += 1
+                    continue
+                if not sheetsclient.sendWithRetry(
+                    self.send,
+                    body,
+                    self.limiter,
+                    self.retries,
+                    refresh=self.newerBody,
+                ):
+                    # the frame that replaced the refused one is already on the sheet
+                    self.skipped += 1
+                    continue
+            except Exception as err:
+                self.error = err
+                return
+            self.sent += 1
+            self.send_times.append(time.perf_counter())
+            self.report()
+
+    def newerBody(self, body):
+        try:
+            sim = self.pending.get_nowait()
+        except queue.Empty:
+            return body
+        if sim is _STOP:
+            self.pending.put_nowait(sim)
+            return body
+        body = self.encode(sim)
+        # an empty body means the sheet already shows the newer frame, there is nothing
+        # left to retry
+        if not body["requests"]:
+            return None
+        self.merged += 1
+        return body
+
+    def fps(self):
+        # frame rate over the last few sends
+        if len(self.send_times) < 2:
+            return 0.0
+        return (len(self.send_times) - 1) / (self.send_times[-1] - self.send_times[0])
+
+    def report(self):
+        now = time.perf_counter()
+        if self.report_every and now - self.reported_at >= self.report_every:
+            self.reported_at = now
+            print(
+                f"Published {self.sent} frames at {self.fps():.2f} frames/s, "
+                f"dropped {self.dropped} stale frames, skipped {self.skipped} unchanged "
+                f"frames, merged {self.merged} into retries"
+            )
+
+    def close(self, flush: bool = True, timeout: float = None):
+        # with flush the waiting frame is still sent before the thread stops
+        with self.lock:
+            if not flush:
+                try:
+                    self.pending.get_nowait()
+                except queue.Empty:
+                    pass
+        if self.thread.is_alive():
+            self.pending.put(_STOP)
+        self.thread.join(timeout)
@@ -1,31 +1,94 @@
-import utilityclasses.GridObject as GridObject
+import numpy as np
+
+import utilityclasses.GridView as GridView
+
 
 class SimArray:
-    # default value is 40x40 array of 0s
-    def __init__(self, array=[[0.0 for x in range(40)] for y in range(40)]):
-        self.grid = [[0.0 for x in range(40)] for y in range(40)]
-        for x in range(len(array)):
-            for y in range(len(array[0])):
-                self.grid[x][y] = GridObject.GridObject(float(array[x][y]*100 if (array[x][y]==1 or array[x][y]==1) else array[x][y]), (x, y))
-                
-    
+    # state is kept as one contiguous array per field, sim[x][y] returns a view of a cell
+    # default value is 40x40 array of 0s. dtype is float64 or float32 for every float field
+    def __init__(self, array=None, ux=None, uy=None, land=None, dtype=np.float64):
+        if array is None:
+            array = np.zeros((40, 40))
+        self.density = np.array(array, dtype=dtype)
+        # cells marked with a 1 are full cells
+        self.density[self.density == 1] = 100.0
+        shape = self.density.shape
+        self.ux = np.zeros(shape, dtype) if ux is None else np.array(ux, dtype=dtype)
+        self.uy = np.zeros(shape, dtype) if uy is None else np.array(uy, dtype=dtype)
+        self.land = (
+            np.zeros(shape, dtype=bool) if land is None else np.array(land, dtype=bool)
+        )
+        if self.land.shape != shape:
+            raise ValueError(f"land mask of shape {self.land.shape} on a {shape} grid")
+        # land cells hold no fluid
+        self.density[self.land] = 0.0
+
+    @classmethod
+    def fromArrays(cls, density, ux, uy, land=None):
+        # wraps existing arrays without copying them or rescaling full cells
+        sim = cls.__new__(cls)
+        sim.density = density
+        sim.ux = ux
+        sim.uy = uy
+        sim.land = np.zeros(density.shape, dtype=bool) if land is None else land
+        return sim
+
+    @property
+    def shape(self):
+        return self.density.shape
+
+    @property
+    def dtype(self):
+        return self.density.dtype
+
     def len(self):
-        return len(self.grid)
-    
+        return self.density.shape[0]
+
     def __getitem__(self, key):
-        return self.grid[key]
-    
+        if not -self.len() <= key < self.len():
+            raise IndexError("grid row index out of range")
+        return GridView.RowView(self, key % self.len())
+
+    def __iter__(self):
+        return (GridView.RowView(self, x) for x in range(self.len()))
+
     def __str__(self):
-        #return string representation of self.grid where each GridObject.GridObject is called with print()
-        return '\n' + '\n'.join([''.join([str(cell) for cell in row]) for row in self.grid])
-    
+        # return string representation of the grid with each cell printed like a GridObject
+        return "\n" + "\n".join(
+            [
+                "".join([str(cell) + " " for cell in row])
+                for row in self.density.tolist()
+            ]
+        )
+
     def printIndices(self):
-        #return string representation of self.grid where each GridObject.GridObject is called with print()
-        return '\n' + '\n'.join([''.join([str(cell.index) for cell in row]) for row in self.grid])
-    
+        return "\n" + "\n".join(
+            [
+                "".join([str((x, y)) for y in range(self.shape[1])])
+                for x in range(self.len())
+            ]
+        )
+
+    def nbytes(self):
+        return self.density.nbytes + self.ux.nbytes + self.uy.nbytes + self.land.nbytes
+
     def copy(self):
-        #print(self)
-        #print(SimArray([[self.grid[x][y].Density for y in range(len(self.grid[0]))] for x in range(len(self.grid))]))
-        return SimArray([[self.grid[x][y].Density for y in range(len(self.grid[0]))] for x in range(len(self.grid))])
-    
-    
\ No newline at end of file
+        return SimArray.fromArrays(
+            self.density.copy(), self.ux.copy(), self.uy.copy(), self.land.copy()
+        )
+
+    def astype(self, dtype):
+        # a copy with the float fields in dtype, or this state if they already are
+        if self.dtype == dtype:
+            return self
+        return SimArray.fromArrays(
+            *(field.astype(dtype) for field in (self.density, self.ux, self.uy)),
+            self.land.copy(),
+        )
+
+    def readOnly(self):
+        # the same state behind views that can't be written to
+        views = [field.view() for field in (self.density, self.ux, self.uy, self.land)]
+        for view in views:
+            view.flags.writeable = False
+        return SimArray.fromArrays(*views)
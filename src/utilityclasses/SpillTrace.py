@@ -0,0 +1,119 @@
+import numpy as np
+
+# one spill from (source_x, source_y) to (dest_x, dest_y), with both cells' densities just
+# before and just after the fluid moved
+EVENT = np.dtype(
+    [
+        ("step", "<i8"),
+        ("source_x", "<i4"),
+        ("source_y", "<i4"),
+        ("dest_x", "<i4"),
+        ("dest_y", "<i4"),
+        ("amount", "<f8"),
+        ("source_before", "<f8"),
+        ("dest_before", "<f8"),
+        ("source_after", "<f8"),
+        ("dest_after", "<f8"),
+    ]
+)
+
+
+class SpillTrace:
+    # a preallocated ring buffer of spill events, filled by the loop engine in place of
+    # printing them. the engine collects a step's events as tuples and hands them over in
+    # one block, so tracing costs a list append per spill and nothing when it's off.
+    # once full the oldest events are overwritten
+    def __init__(self, capacity: int = 100_000):
+        self.buffer = np.zeros(capacity, dtype=EVENT)
+        self.count = 0
+        self.steps = 0
+
+    @property
+    def capacity(self):
+        return len(self.buffer)
+
+    @property
+    def dropped(self):
+        return max(self.count - self.capacity, 0)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def extend(self, events):
+        # events are EVENT tuples for one step, stamped with self.steps by the engine
+        self.steps += 1
+        if not events:
+            return
+        block = np.array(events, dtype=EVENT)[-self.capacity :]
+        start = (self.count + len(events) - len(block)) % self.capacity
+        first = min(len(block), self.capacity - start)
+        self.buffer[start : start + first] = block[:first]
+        self.buffer[: len(block) - first] = block[first:]
+        self.count += len(events)
+
+    def events(self):
+        # the kept events, oldest first
+        if self.count <= self.capacity:
+            return self.buffer[: self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.buffer[start:], self.buffer[:start]))
+
+    def select(self, rows=None, cols=None, steps=None):
+        # events whose source or destination lies in the [start, stop) rows and cols, and
+        # whose step is in [start, stop) steps
+        events = self.events()
+        keep = np.ones(len(events), dtype=bool)
+        if rows is not None or cols is not None:
+            inside = []
+            for x, y in (("source_x", "source_y"), ("dest_x", "dest_y")):
+                cell = np.ones(len(events), dtype=bool)
+                for field, bounds in ((x, rows), (y, cols)):
+                    if bounds is not None:
+                        cell &= (events[field] >= bounds[0]) & (
+                            events[field] < bounds[1]
+                        )
+                inside.append(cell)
+            keep &= inside[0] | inside[1]
+        if steps is not None:
+            keep &= (events["step"] >= steps[0]) & (events["step"] < steps[1])
+        return events[keep]
+
+    def dump(self, path: str, events=None):
+        # .csv writes text with a header, anything else a .npy record array
+        events = self.events() if events is None else events
+        if path.endswith(".csv"):
+            np.savetxt(
+                path,
+                events,
+                fmt=["%d"] * 5 + ["%.17g"] * 5,
+                delimiter=",",
+                header=",".join(EVENT.names),
+                comments="",
+            )
+        else:
+            np.save(path, events)
+
+    def clear(self):
+        self.count = 0
+        self.steps = 0
+
+
+# the lines the loop engine used to print for every spill
+def formatEvents(events):
+    return "\n".join(
+        f"Spilling {amount} from ({x}, {y}) to ({nx}, {ny})\n"
+        f"Before: {source_before}, {dest_before}\n"
+        f"After: {source_after}, {dest_after}"
+        for (
+            _,
+            x,
+            y,
+            nx,
+            ny,
+            amount,
+            source_before,
+            dest_before,
+            source_after,
+            dest_after,
+        ) in events
+    )
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class SteadyState:
+    # watches consecutive states for the largest change of any density or velocity cell,
+    # and calls the run steady once that residual stayed under tolerance for `patience`
+    # states in a row. only the previous state is kept, by reference, so the states given to
+    # update must not be overwritten afterwards, which holds for simulation.iterate's frames.
+    # interval() backs off the time between checks while the run is steady
+    def __init__(
+        self,
+        tolerance: float = 1e-3,
+        patience: int = 10,
+        backoff: float = 2.0,
+        max_interval: float = 60.0,
+    ):
+        self.tolerance = tolerance
+        self.patience = patience
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.previous = None
+        self.scratch = None
+        self.residual = float("inf")
+        self.calm = 0
+        self.idle = 0
+
+    @property
+    def steady(self):
+        return self.calm >= self.patience
+
+    def update(self, sim):
+        fields = (sim.density, sim.ux, sim.uy)
+        if self.previous is None or self.previous[0].shape != sim.shape:
+            self.scratch = np.empty(sim.shape, dtype=sim.density.dtype)
+            self.residual = float("inf")
+        else:
+            self.residual = 0.0
+            for field, previous in zip(fields, self.previous):
+                difference = np.subtract(field, previous, out=self.scratch)
+                self.residual = max(
+                    self.residual,
+                    float(np.abs(difference, out=difference).max(initial=0)),
+                )
+        self.previous = fields
+        if self.residual < self.tolerance:
+            self.calm += 1
+        else:
+            self.calm = 0
+            self.idle = 0
+        return self.residual
+
+    def interval(self, base: float):
+        # base until steady, then base * backoff ** n on the nth steady check (1 second for
+        # a base of 0), capped at max_interval or base if that is longer
+        if not self.steady:
+            return base
+        self.idle += 1
+        return max(
+            base, min((base or 1.0) * self.backoff**self.idle, self.max_interval)
+        )
+
+    def reset(self):
+        self.previous = None
+        self.residual = float("inf")
+        self.calm = 0
+        self.idle = 0
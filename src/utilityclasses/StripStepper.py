@@ -0,0 +1,101 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import engines
+
+# rows of halo read on each side of a strip. a cell is updated from its neighbours, and
+# how much a neighbour spills depends on that neighbour's own neighbours, so a strip
+# needs two rows from each adjacent strip to reproduce the serial step exactly
+HALO = 2
+
+# state fields kept in shared memory, once for the current step and once for the result
+FIELDS = 3
+
+_worker_block = None
+_worker_arrays = None
+_worker_land_block = None
+_worker_land = None
+
+
+def _attachWorker(name, land_name, shape, dtype):
+    global _worker_arrays, _worker_block, _worker_land, _worker_land_block
+    _worker_block = shared_memory.SharedMemory(name=name)
+    _worker_arrays = np.ndarray(
+        (2, FIELDS) + shape, dtype=dtype, buffer=_worker_block.buf
+    )
+    _worker_land_block = shared_memory.SharedMemory(name=land_name)
+    _worker_land = np.ndarray(shape, dtype=bool, buffer=_worker_land_block.buf)
+
+
+def _stepStrip(task):
+    start, stop, engine = task
+    current, result = _worker_arrays
+    rows = current.shape[1]
+    low = max(start - HALO, 0)
+    high = min(stop + HALO, rows)
+    # the halo rows are stepped too but thrown away, only the strip's own rows are written
+    new_state = engines.ENGINES[engine](
+        *current[:, low:high], land=_worker_land[low:high]
+    )
+    for field, new_field in zip(result, new_state):
+        field[start:stop] = new_field[start - low : stop - low]
+
+
+class StripStepper:
+    # steps a grid on a process pool by splitting it into row strips over shared memory,
+    # holding states of the given float dtype
+    def __init__(
+        self, shape, workers: int = None, engine: str = "numpy", dtype=np.float64
+    ):
+        self.shape = tuple(shape)
+        self.engine = engine
+        self.dtype = np.dtype(dtype)
+        workers = min(workers or mp.cpu_count(), self.shape[0])
+        self.block = shared_memory.SharedMemory(
+            create=True,
+            size=2 * FIELDS * int(np.prod(self.shape)) * self.dtype.itemsize,
+        )
+        self.current, self.result = np.ndarray(
+            (2, FIELDS) + self.shape, dtype=self.dtype, buffer=self.block.buf
+        )
+        self.land_block = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(self.shape))
+        )
+        self.land = np.ndarray(self.shape, dtype=bool, buffer=self.land_block.buf)
+        bounds = np.linspace(0, self.shape[0], workers + 1).astype(int)
+        self.tasks = [
+            (int(start), int(stop), engine) for start, stop in zip(bounds, bounds[1:])
+        ]
+        self.pool = mp.Pool(
+            workers,
+            initializer=_attachWorker,
+            initargs=(self.block.name, self.land_block.name, self.shape, self.dtype),
+        )
+
+    @property
+    def workers(self):
+        return len(self.tasks)
+
+    def step(self, densities, ux, uy, land=None):
+        self.current[0] = densities
+        self.current[1] = ux
+        self.current[2] = uy
+        self.land[...] = False if land is None else land
+        self.pool.map(_stepStrip, self.tasks)
+        return tuple(field.copy() for field in self.result)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        del self.current, self.result, self.land
+        for block in (self.block, self.land_block):
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
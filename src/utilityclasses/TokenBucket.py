@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class TokenBucket:
+    # allows `rate` calls per second on average with bursts of up to `capacity` calls
+    def __init__(
+        self, rate: float, capacity: float = 1, clock=time.monotonic, sleep=time.sleep
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def tryAcquire(self, tokens: float = 1):
+        with self.lock:
+            self.refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def waitTime(self, tokens: float = 1):
+        with self.lock:
+            self.refill()
+            return max(tokens - self.tokens, 0) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        # blocks until the tokens are available, returns how long it waited
+        waited = 0.0
+        while not self.tryAcquire(tokens):
+            delay = self.waitTime(tokens)
+            self.sleep(delay)
+            waited += delay
+        return waited
@@ -0,0 +1,199 @@
+import os
+import struct
+import weakref
+
+import numpy as np
+
+import utilityclasses.SimArray as SimArray
+
+MAGIC = b"FLUIDTRJ"
+VERSION = 1
+# magic, version, float dtype string, rows, cols
+HEADER = struct.Struct("<8sI8sII")
+# records start on a 64 byte boundary so every array in them stays aligned
+HEADER_SIZE = 64
+
+
+def recordType(shape, dtype=float):
+    fields = np.dtype(
+        [
+            ("step", "<i8"),
+            ("density", dtype, shape),
+            ("ux", dtype, shape),
+            ("uy", dtype, shape),
+            ("land", "u1", shape),
+        ]
+    )
+    # padded to a multiple of the header size so the arrays of every record are aligned
+    return np.dtype(
+        {
+            "names": fields.names,
+            "formats": [fields.fields[name][0] for name in fields.names],
+            "offsets": [fields.fields[name][1] for name in fields.names],
+            "itemsize": -(-fields.itemsize // HEADER_SIZE) * HEADER_SIZE,
+        }
+    )
+
+
+class Trajectory:
+    # a checkpoint file of simulation states: a fixed size header followed by one record per
+    # saved step holding the step number and the raw density, ux, uy and land arrays. frames
+    # are only ever appended, and the file is read through a memory map so any frame can be
+    # replayed without re-simulating or loading the others. a record cut short by a crash is
+    # ignored, so a run can always resume from the last complete frame
+    def __init__(self, path: str, shape=None, dtype=float):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.readHeader()
+            if shape is not None and tuple(shape) != self.shape:
+                raise ValueError(f"{path} holds {self.shape} grids, not {tuple(shape)}")
+        elif shape is None:
+            raise FileNotFoundError(f"{path} does not exist, give a shape to create it")
+        else:
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            with open(path, "wb") as file:
+                file.write(
+                    HEADER.pack(
+                        MAGIC, VERSION, self.dtype.str.encode(), *self.shape
+                    ).ljust(HEADER_SIZE, b"\0")
+                )
+        self.record = recordType(self.shape, self.dtype)
+        self.file = None
+        self.map = None
+        # weak references to every map handed out, frames read from them are views into it
+        self.maps = []
+        # the number of frames to keep once the next frame is appended, set by resume
+        self.end = None
+        self.last = None
+
+    def readHeader(self):
+        with open(self.path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+        if len(header) < HEADER.size or header[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a trajectory file")
+        _, version, dtype, rows, cols = HEADER.unpack_from(header)
+        if version != VERSION:
+            raise ValueError(f"{self.path} has unsupported version {version}")
+        self.dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        self.shape = (rows, cols)
+
+    def __len__(self):
+        return (os.path.getsize(self.path) - HEADER_SIZE) // self.record.itemsize
+
+    def append(self, sim, step: int = None):
+        # steps have to increase, indexOf looks them up by bisection
+        if sim.shape != self.shape:
+            raise ValueError(f"Cannot append a {sim.shape} grid to {self.shape} frames")
+        if self.file is None or self.end is not None:
+            # drops a record left incomplete by a crash, or the frames after the one a run
+            # resumed from, before appending after it
+            self.truncate(len(self) if self.end is None else self.end)
+            self.end = None
+            self.last = int(self.steps()[-1]) if len(self) else None
+            self.map = None
+            self.file = open(self.path, "ab")
+        if step is None:
+            step = 0 if self.last is None else self.last + 1
+        elif self.last is not None and step <= self.last:
+            raise ValueError(
+                f"step {step} does not follow step {self.last} in {self.path}"
+            )
+        record = np.empty((), dtype=self.record)
+        record["step"] = step
+        record["density"] = sim.density
+        record["ux"] = sim.ux
+        record["uy"] = sim.uy
+        record["land"] = sim.land
+        self.file.write(record.tobytes())
+        self.last = step
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def frames(self):
+        # a read only memory map over the complete records, remapped when the file grew
+        self.flush()
+        count = len(self)
+        if self.map is None or len(self.map) != count:
+            self.map = (
+                np.memmap(
+                    self.path,
+                    dtype=self.record,
+                    mode="r",
+                    offset=HEADER_SIZE,
+                    shape=(count,),
+                )
+                if count
+                else np.empty(0, dtype=self.record)
+            )
+            self.maps.append(weakref.ref(self.map))
+        return self.map
+
+    def steps(self):
+        return self.frames()["step"]
+
+    def __getitem__(self, index: int):
+        # frame `index` as a SimArray over the memory map, nothing is copied
+        frame = self.frames()[index]
+        return SimArray.SimArray.fromArrays(
+            frame["density"], frame["ux"], frame["uy"], frame["land"].view(bool)
+        )
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def indexOf(self, step: int):
+        steps = self.steps()
+        index = int(np.searchsorted(steps, step))
+        if index == len(steps) or steps[index] != step:
+            raise KeyError(f"step {step} is not in {self.path}")
+        return index
+
+    def atStep(self, step: int):
+        return self[self.indexOf(step)]
+
+    def resume(self, step: int = None):
+        # (step, state) to continue a run from, the last frame by default. nothing is removed
+        # yet, the frames after it are cut off when the continued run appends its first
+        # frame, so they can still be read until then. the state is a writable copy
+        if not len(self):
+            raise ValueError(f"{self.path} has no frames to resume from")
+        index = len(self) - 1 if step is None else self.indexOf(step)
+        self.end = index + 1
+        return int(self.steps()[index]), self[index].copy()
+
+    def truncate(self, count: int):
+        # closes the file, the next append reopens it after the kept frames
+        self.close()
+        size = HEADER_SIZE + count * self.record.itemsize
+        self.maps = [ref for ref in self.maps if ref() is not None]
+        if not self.maps:
+            with open(self.path, "r+b") as file:
+                file.truncate(size)
+            return
+        # frames read earlier are views into the file, and shrinking it under them would
+        # crash the process on the next read. the kept frames are copied to a new file that
+        # replaces this one, and the old one stays readable for as long as they're around
+        self.maps = []
+        temporary = self.path + ".tmp"
+        with open(self.path, "rb") as source, open(temporary, "wb") as target:
+            while target.tell() < size:
+                chunk = source.read(min(1 << 20, size - target.tell()))
+                if not chunk:
+                    break
+                target.write(chunk)
+        os.replace(temporary, self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()